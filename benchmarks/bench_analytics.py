@@ -0,0 +1,60 @@
+"""Compare a full spend aggregation with an incremental update.
+
+Fills a temporary receipt store with synthetic receipts, builds the spend
+aggregates from scratch, then adds a few receipts and times the incremental
+update the dashboard runs after each upload.
+
+    python benchmarks/bench_analytics.py --receipts 100000 --new 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_store import synthetic_receipt  # noqa: E402
+
+from ri_system.analytics import SpendAggregator  # noqa: E402
+from ri_system.store import ReceiptStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", type=int, default=100_000)
+    parser.add_argument("--new", type=int, default=20, help="Receipts added before the incremental update")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReceiptStore(os.path.join(tmp, "receipts.sqlite3"))
+        for offset in range(0, args.receipts, 1000):
+            n = min(1000, args.receipts - offset)
+            store.add_many([(synthetic_receipt(rng), f"hash-{offset + i}", None) for i in range(n)])
+
+        aggregator = SpendAggregator()
+        started = time.perf_counter()
+        snapshot = aggregator.update(store)
+        full_ms = (time.perf_counter() - started) * 1000
+
+        store.add_many([(synthetic_receipt(rng), f"new-{i}", None) for i in range(args.new)])
+        started = time.perf_counter()
+        aggregator.update(store)
+        incremental_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{snapshot['receipts']:,} receipts, {snapshot['items']:,} line items")
+        print(f"full aggregation:     {full_ms:8.1f} ms")
+        print(f"incremental (+{args.new}):    {incremental_ms:8.1f} ms")
+        print(json.dumps({
+            "receipts": snapshot["receipts"],
+            "items": snapshot["items"],
+            "full_ms": round(full_ms, 1),
+            "incremental_ms": round(incremental_ms, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
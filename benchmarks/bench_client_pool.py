@@ -0,0 +1,109 @@
+"""Compare per-request overhead of a new Gemini client per call vs a pooled client.
+
+Runs against a local stub of the generateContent endpoint, so the numbers
+measure only client setup and connection handling, not model latency.
+
+    python benchmarks/bench_client_pool.py --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from ri_system.clients import ClientPool  # noqa: E402
+
+RESPONSE = json.dumps({
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "{}"}]}}],
+    "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2},
+}).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a canned generateContent response."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubHandler.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_client_factory(base_url):
+    def factory(api_key):
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=base_url))
+    return factory
+
+
+def run(label, get_client, requests):
+    StubHandler.connections.clear()
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client = get_client()
+        client.models.generate_content(model="gemini-2.5-flash", contents="ping")
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mode": label,
+        "requests": requests,
+        "connections": len(StubHandler.connections),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    server = start_stub()
+    factory = stub_client_factory(f"http://127.0.0.1:{server.server_port}")
+    pool = ClientPool(factory=factory)
+
+    # Warm up imports and lazy SDK initialization before timing either mode
+    warmup = factory("bench-key")
+    warmup.models.generate_content(model="gemini-2.5-flash", contents="ping")
+    warmup.close()
+
+    results = [
+        run("client per request", lambda: factory("bench-key"), args.requests),
+        run("pooled client", lambda: pool.get("bench-key"), args.requests),
+    ]
+    pool.close_all()
+    server.shutdown()
+
+    print(f"{'mode':<20} {'conns':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in results:
+        print(f"{r['mode']:<20} {r['connections']:>6} {r['mean_ms']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measure near-duplicate detection: hash robustness and lookup latency.
+
+Hashes synthetic receipts and edited copies of them (recompressed, resized,
+cropped, brightened, slightly rotated) to show which edits still match, then
+times index lookups against a large history of hashes. No API key needed.
+
+    python benchmarks/bench_dedupe.py --history 100000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_preprocess import synthetic_receipt  # noqa: E402
+from PIL import Image, ImageFilter, ImageOps  # noqa: E402
+
+from ri_system.dedupe import MAX_DISTANCE, HashIndex, dhash, hamming  # noqa: E402
+
+EDITS = {
+    "recompressed": lambda im: im,
+    "half size": lambda im: im.resize((im.width // 2, im.height // 2)),
+    "cropped 5%": lambda im: im.crop((im.width // 20, im.height // 20, im.width * 19 // 20, im.height * 19 // 20)),
+    "brighter": lambda im: im.point(lambda p: min(255, int(p * 1.2))),
+    "rotated 1 deg": lambda im: im.rotate(1, fillcolor=(214, 204, 188)),
+    "grayscale": lambda im: im.convert("L"),
+    "blurred": lambda im: im.filter(ImageFilter.GaussianBlur(2)),
+}
+
+
+def edited(image_bytes, edit):
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    buffer = io.BytesIO()
+    edit(image).save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+def flip_bits(value, n, rng, bits=256):
+    for position in rng.sample(range(bits), n):
+        value ^= 1 << position
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", type=int, default=8, help="Distinct synthetic receipts to hash")
+    parser.add_argument("--history", type=int, default=100_000, help="Hashes in the lookup index")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    originals = [synthetic_receipt(1500, 2000, seed=seed) for seed in range(args.receipts)]
+    started = time.perf_counter()
+    hashes = [dhash(image) for image in originals]
+    hash_ms = (time.perf_counter() - started) * 1000 / len(originals)
+
+    edits = {
+        label: statistics.median(hamming(h, dhash(edited(image, edit))) for image, h in zip(originals, hashes))
+        for label, edit in EDITS.items()
+    }
+    distinct = [hamming(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+    print(f"dhash: {hash_ms:.1f} ms per 1500x2000 JPEG, match threshold {MAX_DISTANCE} bits of 256")
+    for label, distance in edits.items():
+        print(f"  {label:<14} {distance:>5.0f} bits  {'match' if distance <= MAX_DISTANCE else 'MISS'}")
+    print(f"  distinct receipts: min {min(distinct)} bits, median {statistics.median(distinct):.0f} bits")
+
+    # Lookup latency and recall against a large history of unrelated hashes
+    rng = random.Random(0)
+    index = HashIndex()
+    history = [rng.getrandbits(256) for _ in range(args.history)]
+    for i, value in enumerate(history):
+        index.add(f"{value:064x}", i)
+    latencies, found = [], 0
+    for _ in range(args.queries):
+        target = rng.randrange(args.history)
+        query = flip_bits(history[target], rng.randint(0, MAX_DISTANCE), rng)
+        started = time.perf_counter()
+        matches = index.search(f"{query:064x}", MAX_DISTANCE)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found += any(item == target for _, item in matches)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"lookup over {args.history:,} hashes: p50 {p50:.3f} ms, p99 {p99:.3f} ms, "
+          f"recall {found / args.queries:.1%} for 0-{MAX_DISTANCE} flipped bits")
+    print(json.dumps({
+        "hash_ms": round(hash_ms, 2),
+        "edit_distances": edits,
+        "distinct_min": min(distinct),
+        "lookup_p50_ms": round(p50, 3),
+        "lookup_p99_ms": round(p99, 3),
+        "recall": round(found / args.queries, 3),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Parse work for a streamed receipt: re-parsing the text so far per chunk vs resuming.
+
+Streams the JSON of synthetic folios with 100, 300 and 1000 line items in
+fixed-size chunks, the way Gemini's streaming API delivers them, and times
+the CPU spent parsing the whole stream. "reparse" runs `parse_partial` on
+everything received after each chunk (the old `StreamingJSON.feed`);
+"incremental" is the current `StreamingJSON`. No API key or network needed.
+
+    python benchmarks/bench_jsonstream.py --items 100 300 1000 --chunk 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_render import synthetic_folio  # noqa: E402
+
+from ri_system.jsonstream import StreamingJSON, parse_partial  # noqa: E402
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def reparse(parts):
+    text, value, updates = "", None, 0
+    for part in parts:
+        text += part
+        partial = parse_partial(text)
+        if partial != value:
+            value, updates = partial, updates + 1
+    return value, updates
+
+
+def incremental(parts):
+    parsed, updates = StreamingJSON(), 0
+    for part in parts:
+        updates += parsed.feed(part)
+    return parsed.value, updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--chunk", type=int, default=200, help="characters per streamed chunk")
+    parser.add_argument("--skip-reparse", action="store_true", help="only time the incremental parser")
+    args = parser.parse_args()
+
+    results = []
+    for n_items in args.items:
+        receipt = synthetic_folio(n_items)
+        parts = chunks(json.dumps(receipt, indent=2), args.chunk)
+        row = {"items": n_items, "chunks": len(parts)}
+        for name, parse in (("reparse", reparse), ("incremental", incremental)):
+            if name == "reparse" and args.skip_reparse:
+                continue
+            started = time.process_time()
+            value, updates = parse(parts)
+            elapsed = time.process_time() - started
+            assert value == receipt, f"{name} did not recover the receipt"
+            row[f"{name}_s"] = round(elapsed, 3)
+            row[f"{name}_updates"] = updates
+        results.append(row)
+        print(f"{n_items:5d} items, {len(parts):5d} chunks: "
+              + ", ".join(f"{name} {row[f'{name}_s']:7.3f} s CPU"
+                          for name in ("reparse", "incremental") if f"{name}_s" in row))
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
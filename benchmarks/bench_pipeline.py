@@ -0,0 +1,182 @@
+"""Per-stage timings of the extraction pipeline, with the model replaced by recorded responses.
+
+Runs a corpus of synthetic receipt photos through every stage the app runs,
+against a zero-latency `ReplayBackend`, so only our own overhead is measured:
+image decode, resize and encode, request build, the (replayed) model call,
+JSON cleanup and parse, the whole `analyze_receipt()`, and `display_results()`
+rendering. No API key or network needed.
+
+Each receipt's fastest of a few passes counts, to keep run-to-run noise down.
+Prints a table and a final JSON line. `--out` saves the results; `--baseline`
+compares against results saved on the same machine and exits non-zero when a
+stage's median got slower by more than `--tolerance`.
+
+    python benchmarks/bench_pipeline.py --receipts 20 --out pipeline.json
+    python benchmarks/bench_pipeline.py --baseline pipeline.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_preprocess import synthetic_receipt  # noqa: E402
+from bench_render import synthetic_folio  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from ri_system import extraction  # noqa: E402
+from ri_system.backends import ReplayBackend  # noqa: E402
+from ri_system.cache import hash_bytes  # noqa: E402
+from ri_system.imaging import preprocess_image  # noqa: E402
+from ri_system.jsonstream import strip_fences  # noqa: E402
+from ri_system.resilience import Resilience  # noqa: E402
+from ri_system.schema import parse_receipt  # noqa: E402
+
+STAGES = ("decode", "resize", "encode", "request_build", "model_call", "parse", "analyze_receipt", "render")
+# Changes smaller than this (ms) are noise, whatever the relative change
+NOISE_MS = 0.5
+
+
+def build_corpus(n, width, height, seed=0):
+    """`(image_bytes, receipt_data)` pairs: photos of varying size and receipts of 5 to 200 items."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        scale = rng.uniform(0.6, 1.0)
+        image = synthetic_receipt(int(width * scale), int(height * scale), lines=rng.randint(20, 80), seed=seed + i)
+        corpus.append((image, synthetic_folio(rng.choice([5, 20, 60, 200]), seed=seed + i)))
+    return corpus
+
+
+def render_corpus(receipts, root, repeats):
+    """AppTest script: render each receipt into one placeholder, keeping each receipt's fastest render."""
+    import sys
+    import time
+
+    sys.path.insert(0, root)
+    import streamlit as st
+    from ri_system.render import display_results
+
+    placeholder = st.empty()
+    timings = [float("inf")] * len(receipts)
+    for _ in range(repeats):
+        for i, receipt in enumerate(receipts):
+            started = time.perf_counter()
+            with placeholder.container():
+                display_results(receipt)
+            timings[i] = min(timings[i], time.perf_counter() - started)
+    st.session_state["timings"] = timings
+
+
+def run(corpus, repeats):
+    """Stage name -> list of seconds, one entry per receipt (its fastest of `repeats` passes)."""
+    timings = {stage: [float("inf")] * len(corpus) for stage in STAGES}
+
+    def record(stage, i, seconds):
+        timings[stage][i] = min(timings[stage][i], seconds)
+
+    payloads = [preprocess_image(image, "image/jpeg")[0] for image, _ in corpus]
+    backend = ReplayBackend({hash_bytes(payload): json.dumps(data) for payload, (_, data) in zip(payloads, corpus)})
+    # No retries or throttling in play, but the same code path as production
+    resilience = Resilience()
+
+    for _ in range(repeats):
+        for i, (image, _) in enumerate(corpus):
+            _, _, stats = preprocess_image(image, "image/jpeg")
+            record("decode", i, stats["decode_seconds"])
+            record("resize", i, stats["resize_seconds"])
+            record("encode", i, stats["encode_seconds"])
+
+        for i, payload in enumerate(payloads):
+            started = time.perf_counter()
+            contents = extraction.build_contents(payload, "image/jpeg", extraction.build_system_prompt(None))
+            config = extraction.generation_config(None)
+            built = time.perf_counter()
+            response = backend.models.generate_content(model=extraction.MODEL_NAME, contents=contents, config=config)
+            called = time.perf_counter()
+            parse_receipt(strip_fences(response.text))
+            parsed = time.perf_counter()
+            record("request_build", i, built - started)
+            record("model_call", i, called - built)
+            record("parse", i, parsed - called)
+
+        for i, payload in enumerate(payloads):
+            started = time.perf_counter()
+            _, error = extraction.analyze_receipt(payload, "image/jpeg", backend, resilience=resilience)
+            record("analyze_receipt", i, time.perf_counter() - started)
+            if error:
+                raise SystemExit(error)
+
+    receipts = [data for _, data in corpus]
+    at = AppTest.from_function(render_corpus, args=(receipts, ROOT, repeats), default_timeout=300)
+    at.run()
+    if at.exception:
+        raise SystemExit(at.exception[0].message)
+    timings["render"] = at.session_state["timings"]
+    return timings
+
+
+def summarize(timings):
+    summary = {}
+    for stage, seconds in timings.items():
+        ms = sorted(s * 1000 for s in seconds)
+        summary[stage] = {
+            "p50_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+            "mean_ms": round(statistics.fmean(ms), 3),
+        }
+    return summary
+
+
+def regressions(summary, baseline, tolerance):
+    """Stages whose median is slower than the baseline's by more than `tolerance` (and noise)."""
+    slower = []
+    for stage, stats in summary.items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        limit = max(before["p50_ms"] * (1 + tolerance), before["p50_ms"] + NOISE_MS)
+        if stats["p50_ms"] > limit:
+            slower.append(f"{stage}: {before['p50_ms']:.2f} -> {stats['p50_ms']:.2f} ms")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", type=int, default=20)
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=3200)
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the corpus; each receipt's fastest counts")
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --out")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown per stage")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.receipts, args.width, args.height)
+    summary = summarize(run(corpus, args.repeats))
+    result = {"receipts": args.receipts, "image_size": [args.width, args.height], "stages": summary}
+
+    for stage, stats in summary.items():
+        print(f"{stage:<16} p50 {stats['p50_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["regressions"] = regressions(summary, json.load(f), args.tolerance)
+        for line in result["regressions"]:
+            print(f"SLOWER  {line}")
+        status = 1 if result["regressions"] else 0
+    print(json.dumps(result))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Report payload size and preprocessing time for each preprocessing setting.
+
+Generates a synthetic phone-photo-sized receipt (no API key or network
+needed) and runs it through `preprocess_image` with a range of settings.
+
+    python benchmarks/bench_preprocess.py --width 3000 --height 4000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+from ri_system.imaging import EXIF_ORIENTATION, PreprocessSettings, format_bytes, preprocess_image  # noqa: E402
+
+SETTINGS = {
+    "original": PreprocessSettings(enabled=False),
+    "default (2048px, q85)": PreprocessSettings(),
+    "1536px, q80": PreprocessSettings(max_long_edge=1536, quality=80),
+    "1024px, q75": PreprocessSettings(max_long_edge=1024, quality=75),
+    "2048px, gray": PreprocessSettings(grayscale=True),
+    "2048px, gray+contrast": PreprocessSettings(grayscale=True, autocontrast=True),
+}
+
+
+def synthetic_receipt(width, height, lines=80, seed=0):
+    """Draw a noisy, slightly blurred receipt photo and encode it like a phone camera would."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (214, 204, 188))
+    draw = ImageDraw.Draw(image)
+    margin = width // 6
+    draw.rectangle([margin, 0, width - margin, height], fill=(246, 244, 238))
+    line_height = height // (lines + 4)
+    for i in range(lines):
+        y = (i + 2) * line_height
+        x = margin + rng.randint(20, 60)
+        for _ in range(rng.randint(3, 8)):
+            word = rng.randint(line_height // 2, line_height * 3)
+            draw.rectangle([x, y, x + word, y + line_height // 2], fill=(40, 40, 40))
+            x += word + line_height // 2
+        draw.text((width - margin - 200, y), f"{rng.uniform(1, 99):.2f}", fill=(30, 30, 30))
+    image = image.filter(ImageFilter.GaussianBlur(1.2))
+    noise = Image.effect_noise((width, height), 18).convert("RGB")
+    image = Image.blend(image, noise, 0.08)
+
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6  # stored sideways, like most portrait phone shots
+    buffer = io.BytesIO()
+    image.transpose(Image.ROTATE_90).save(buffer, format="JPEG", quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    image_bytes = synthetic_receipt(args.width, args.height)
+    results = []
+    for label, settings in SETTINGS.items():
+        timings = []
+        for _ in range(args.repeat):
+            payload, _, stats = preprocess_image(image_bytes, "image/jpeg", settings)
+            timings.append(stats["seconds"] * 1000)
+        results.append({
+            "setting": label,
+            "payload_bytes": len(payload),
+            "size": stats["processed_size"],
+            "saved_pct": round(100 * (1 - len(payload) / len(image_bytes)), 1),
+            "median_ms": round(statistics.median(timings), 1),
+        })
+
+    print(f"input: {args.width}x{args.height} JPEG, {format_bytes(len(image_bytes))}")
+    print(f"{'setting':<24} {'payload':>10} {'saved':>7} {'ms':>8}")
+    for r in results:
+        print(f"{r['setting']:<24} {format_bytes(r['payload_bytes']):>10} {r['saved_pct']:>6}% {r['median_ms']:>8}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
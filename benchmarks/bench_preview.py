@@ -0,0 +1,162 @@
+"""Time and peak memory of the upload preview: full decode vs reduced-scale decode.
+
+For each photo size, fresh interpreters run one path each and report the
+wall time, the preview bytes and the peak RSS growth (PIL's pixel buffers
+live outside tracemalloc, so RSS is what counts):
+
+- legacy: `Image.open` and the full-resolution image handed to `st.image`,
+  which encodes it at full size for the browser
+- current: `preview_image` in the app, i.e. `preprocess_image` with the
+  preview settings (JPEG draft decoding at 1/2-1/8 scale, then a thumbnail)
+
+A last run previews several different uploads in one process to show RSS
+stays flat, and feeds `check_upload` a PNG whose header claims 900
+megapixels, which is refused without decoding anything.
+
+    python benchmarks/bench_preview.py --megapixels 12 50
+"""
+import argparse
+import io
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from bench_preprocess import synthetic_receipt  # noqa: E402
+from ri_system.imaging import PreprocessSettings, check_upload, format_bytes, preprocess_image  # noqa: E402
+
+# PREVIEW_IMAGE in app.py (a Streamlit script, so not importable here)
+PREVIEW_IMAGE = PreprocessSettings(max_long_edge=1024, quality=80)
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss_bytes():
+    # VmHWM rather than ru_maxrss, which Linux carries over from the parent across exec
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+
+
+def legacy_preview(data):
+    image = Image.open(io.BytesIO(data))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def current_preview(data):
+    preview, _, _ = preprocess_image(data, "image/jpeg", PREVIEW_IMAGE)
+    return preview
+
+
+def png_header(width, height):
+    """A tiny PNG whose header claims `width` x `height` pixels."""
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"")) + chunk(b"IEND", b""))
+
+
+def child(variant, paths):
+    """Run one variant in this (fresh) process and print its measurements as JSON."""
+    path = legacy_preview if variant == "legacy" else current_preview
+    datas = []
+    for p in paths:
+        with open(p, "rb") as f:
+            datas.append(f.read())
+    before = rss_bytes()
+    rss_after_each = []
+    started = time.perf_counter()
+    for data in datas:
+        preview = path(data)
+        rss_after_each.append(rss_bytes() - before)
+    seconds = (time.perf_counter() - started) / len(datas)
+
+    started = time.perf_counter()
+    try:
+        check_upload(png_header(30000, 30000), "image/png")
+        bomb = "accepted"
+    except ValueError as e:
+        bomb = str(e)
+    print(json.dumps({
+        "seconds": seconds,
+        "preview_bytes": len(preview),
+        "peak_rss_growth": peak_rss_bytes() - before,
+        "rss_growth_after_each": rss_after_each,
+        "bomb_seconds": time.perf_counter() - started,
+        "bomb": bomb,
+    }))
+
+
+def run_child(variant, paths):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", variant, *paths], capture_output=True, text=True
+    )
+    if proc.returncode:
+        raise SystemExit(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 50])
+    parser.add_argument("--uploads", type=int, default=5, help="different uploads previewed in the RSS run")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1:])
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.megapixels:
+            height = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+            path = os.path.join(tmp, f"{mp:g}mp.jpg")
+            with open(path, "wb") as f:
+                f.write(synthetic_receipt(height * 3 // 4, height))
+            row = {"megapixels": mp, "upload_bytes": os.path.getsize(path)}
+            for variant in ("legacy", "current"):
+                measured = run_child(variant, [path])
+                row[variant] = {k: measured[k] for k in ("seconds", "preview_bytes", "peak_rss_growth")}
+            results.append(row)
+            print(
+                f"{mp:>5} MP upload {format_bytes(row['upload_bytes']):>9}: "
+                + ", ".join(
+                    f"{variant} {row[variant]['seconds'] * 1000:6.0f} ms, preview "
+                    f"{format_bytes(row[variant]['preview_bytes']):>9}, peak RSS +{format_bytes(row[variant]['peak_rss_growth'])}"
+                    for variant in ("legacy", "current")
+                )
+            )
+
+        mp = max(args.megapixels)
+        height = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+        paths = []
+        for seed in range(args.uploads):
+            paths.append(os.path.join(tmp, f"upload-{seed}.jpg"))
+            with open(paths[-1], "wb") as f:
+                f.write(synthetic_receipt(height * 3 // 4, height, seed=seed))
+        flat = run_child("current", paths)
+    print(
+        f"{args.uploads} different {mp:g} MP uploads in one process: RSS growth after each "
+        + ", ".join(format_bytes(b) for b in flat["rss_growth_after_each"])
+    )
+    print(f"900 MP PNG bomb: refused in {flat['bomb_seconds'] * 1000:.2f} ms ({flat['bomb']})")
+    print(json.dumps({"sizes": results, "rss_growth_after_each": flat["rss_growth_after_each"], "bomb": flat["bomb"]}))
+
+
+if __name__ == "__main__":
+    main()
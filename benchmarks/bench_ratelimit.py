@@ -0,0 +1,197 @@
+"""Many sessions sharing one API key's quota: 429s, fairness and wait estimates.
+
+A fake Gemini enforces requests and prompt tokens per period over a sliding
+window and answers anything beyond with 429. One batch session runs many
+worker threads against it while a few interactive sessions send one receipt
+at a time, all through one shared `Resilience`, as in the app. Scenarios:
+
+- unlimited: the sessions call the fake directly and lean on retries
+- fifo: one `RateLimiter` for the key, every call in one first-come queue
+- fair: the same limiter with each session as its own owner, taking turns
+
+For each it prints the 429s, failed calls, throughput against the quota,
+and how long the interactive sessions' calls waited. In the fair run every
+interactive call also asks `expected_wait()` first, and the estimate is
+compared with the wait that followed. Exits non-zero if a check fails.
+No API key or network needed.
+
+    python benchmarks/bench_ratelimit.py --batch-threads 32 --users 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors  # noqa: E402
+
+from ri_system.backends import estimate_prompt_tokens  # noqa: E402
+from ri_system.ratelimit import RateLimitedClient, RateLimiter  # noqa: E402
+from ri_system.resilience import AIMDLimiter, Resilience  # noqa: E402
+
+PROMPT = "Extract the merchant, items and totals of this receipt as JSON. " * 3
+
+
+def request(seed):
+    """Contents shaped like an extraction request: prompt text plus one image part."""
+    return [SimpleNamespace(text=PROMPT), SimpleNamespace(inline_data=SimpleNamespace(data=seed.encode()))]
+
+
+class QuotaAPI:
+    """Fake Gemini allowing `rpm` requests and `tpm` prompt tokens in any `period` seconds, 429 beyond."""
+
+    def __init__(self, rpm, tpm, period, latency=0.05, seed=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.period = period
+        self.latency = latency
+        self.models = self
+        self.accepted = deque()  # (time, tokens)
+        self.throttled = 0
+        self.served = 0
+        self.arrived = threading.local()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        now = time.monotonic()
+        self.arrived.at = now
+        with self._lock:
+            # Billed a little off our estimate, as a real image would be
+            billed = estimate_prompt_tokens(contents) + self._rng.randint(-20, 20)
+            while self.accepted and self.accepted[0][0] <= now - self.period:
+                self.accepted.popleft()
+            if len(self.accepted) + 1 > self.rpm or sum(t for _, t in self.accepted) + billed > self.tpm:
+                self.throttled += 1
+                raise errors.ClientError(429, {"error": {
+                    "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0.5s"}],
+                }})
+            self.accepted.append((now, billed))
+            self.served += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(text="{}", usage_metadata=SimpleNamespace(prompt_token_count=billed))
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run(mode, args):
+    api = QuotaAPI(args.rpm, args.tpm, args.period)
+    limiter = RateLimiter(args.rpm, args.tpm, args.period)
+    resilience = Resilience(
+        base_delay=0.2, max_delay=2.0, rng=random.Random(1), limiter=AIMDLimiter(initial=8, maximum=32)
+    )
+    failed = []
+    waits, estimate_errors = [], []
+
+    def client_for(owner):
+        if mode == "unlimited":
+            return api
+        return RateLimitedClient(api, limiter, owner=owner if mode == "fair" else None)
+
+    def call(client, seed):
+        return resilience.call(client.models.generate_content, model="fake", contents=request(seed))
+
+    def batch_worker(i):
+        client = client_for("batch")
+        for j in range(args.batch_calls):
+            try:
+                call(client, f"batch-{i}-{j}")
+            except Exception as e:
+                failed.append(e)
+
+    def user(i):
+        owner = f"user-{i}"
+        client = client_for(owner)
+        for j in range(args.user_calls):
+            time.sleep(args.think)
+            contents = request(f"{owner}-{j}")
+            predicted = limiter.expected_wait(owner, estimate_prompt_tokens(contents))
+            started = time.monotonic()
+            try:
+                resilience.call(client.models.generate_content, model="fake", contents=contents)
+            except Exception as e:
+                failed.append(e)
+                continue
+            waited = api.arrived.at - started
+            waits.append(waited)
+            estimate_errors.append(abs(predicted - waited))
+
+    threads = [threading.Thread(target=batch_worker, args=(i,)) for i in range(args.batch_threads)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    # Let the batch fill the queue before the interactive sessions arrive
+    time.sleep(args.period / 2)
+    users = [threading.Thread(target=user, args=(i,)) for i in range(args.users)]
+    for thread in users:
+        thread.start()
+    for thread in threads + users:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    calls = args.batch_threads * args.batch_calls + args.users * args.user_calls
+    tokens_per_call = estimate_prompt_tokens(request("x"))
+    # Calls per second the quota allows, whichever of its two limits binds
+    allowed = min(args.rpm, args.tpm / tokens_per_call) / args.period
+    return {
+        "calls": calls,
+        "failed": len(failed),
+        "throttled_429": api.throttled,
+        "seconds": round(elapsed, 2),
+        "throughput_vs_quota": round(api.served / elapsed / allowed, 2),
+        "user_wait_p50": round(quantile(waits, 0.5), 3),
+        "user_wait_p95": round(quantile(waits, 0.95), 3),
+        # Estimates follow the owner's turn, so only mean something when sessions take turns
+        "estimate_error_p50": round(quantile(estimate_errors, 0.5), 3) if mode == "fair" else None,
+        "estimate_error_p90": round(quantile(estimate_errors, 0.9), 3) if mode == "fair" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rpm", type=int, default=40, help="Requests the fake allows per period")
+    parser.add_argument("--tpm", type=int, default=10_000, help="Prompt tokens the fake allows per period")
+    parser.add_argument("--period", type=float, default=2.0, help="Quota window in seconds (60 for Gemini)")
+    parser.add_argument("--batch-threads", type=int, default=32)
+    parser.add_argument("--batch-calls", type=int, default=5, help="Calls per batch thread")
+    parser.add_argument("--users", type=int, default=4, help="Interactive sessions")
+    parser.add_argument("--user-calls", type=int, default=6, help="Calls per interactive session")
+    parser.add_argument("--think", type=float, default=0.3, help="Seconds between an interactive session's calls")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("unlimited", "fifo", "fair"):
+        results[mode] = run(mode, args)
+        print(f"{mode:<10}", results[mode])
+
+    fair, fifo = results["fair"], results["fifo"]
+    # One call from each session ahead in the rotation, at the quota's steady rate
+    turn = (args.users + 1) / (min(args.rpm, args.tpm / estimate_prompt_tokens(request("x"))) * 0.9 / args.period)
+    checks = [
+        ("without the limiter the fake throttles", results["unlimited"]["throttled_429"] > 0),
+        ("no call fails with the limiter", fair["failed"] == 0 and fifo["failed"] == 0),
+        ("429s stay under 1% of calls", fair["throttled_429"] <= 0.01 * fair["calls"]),
+        ("throughput reaches 80% of the quota", fair["throughput_vs_quota"] >= 0.8),
+        ("interactive calls wait about one rotation", fair["user_wait_p95"] <= 2 * turn + 0.1),
+        ("taking turns halves the interactive wait", fair["user_wait_p50"] <= fifo["user_wait_p50"] / 2),
+        ("expected_wait within a rotation", fair["estimate_error_p90"] <= turn),
+    ]
+    failed = [name for name, ok in checks if not ok]
+    for name, ok in checks:
+        print(f"{'PASS' if ok else 'FAIL'}  {name}")
+    print(json.dumps({**results, "failed_checks": failed}))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
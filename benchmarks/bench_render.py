@@ -0,0 +1,130 @@
+"""Time rendering of extracted receipts with 10, 100 and 1000 line items.
+
+Renders synthetic receipts (every section filled in, like a hotel folio or a
+long grocery bill) through `display_results` inside Streamlit's AppTest
+harness, so element serialization is included. No API key or network needed.
+
+    python benchmarks/bench_render.py --items 10 100 1000 --repeats 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from ri_system.render import build_items_table  # noqa: E402
+
+
+def synthetic_folio(n_items, seed=0):
+    """A receipt with `n_items` fully populated line items and every optional section set."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        quantity = rng.randint(1, 6)
+        unit_price = round(rng.uniform(0.5, 120), 2)
+        items.append({
+            "item_name": f"Line item {i} {rng.choice(['room', 'minibar', 'laundry', 'spa', 'breakfast'])}",
+            "item_code": f"SKU-{rng.randint(10000, 99999)}",
+            "category": rng.choice(["Lodging", "Food", "Service", "Other"]),
+            "quantity": quantity,
+            "unit": "ea",
+            "unit_price": unit_price,
+            "discount": rng.choice([0, 0, 1.5]),
+            "tax": round(unit_price * quantity * 0.1, 2),
+            "total_price": round(unit_price * quantity, 2),
+            "notes": rng.choice([None, "", "promo"]),
+        })
+    subtotal = round(sum(item["total_price"] for item in items), 2)
+    return {
+        "bill_type": "Hotel/Accommodation",
+        "merchant_info": {
+            "name": "Grand Harbour Hotel", "address": "1 Quay Street", "phone": "+1 555 0100",
+            "email": "stay@example.com", "website": "example.com", "tax_id": "TX-991", "branch": "Downtown",
+        },
+        "transaction_info": {
+            "date": "2024-03-01", "time": "11:02", "receipt_number": "F-1002", "reference_number": "R-77",
+            "cashier": "Ana", "terminal_id": "T4", "table_number": None,
+        },
+        "customer_info": {
+            "name": "J. Doe", "account_number": "A-1", "phone": "555-0101", "email": "jd@example.com",
+            "address": "2 Main St", "loyalty_points": 120,
+        },
+        "items": items,
+        "pricing": {
+            "subtotal": subtotal, "discount_total": 12.0, "discount_description": "member rate",
+            "service_charge": 25.0, "service_charge_percent": 5, "tip": 10.0, "delivery_fee": None,
+            "taxes": [{"tax_name": "VAT", "tax_rate": "10%", "tax_amount": round(subtotal * 0.1, 2)},
+                      {"tax_name": "City tax", "tax_rate": None, "tax_amount": 8.0}],
+            "total_tax": round(subtotal * 0.1 + 8, 2), "total_amount": round(subtotal * 1.1 + 31, 2),
+            "currency": "USD", "currency_symbol": "$",
+        },
+        "payment": {
+            "method": "Credit Card", "card_type": "Visa", "card_last_four": "4242", "amount_tendered": None,
+            "change_given": None, "transaction_id": "TXN-1", "approval_code": "A1B2",
+        },
+        "hotel_details": {
+            "guest_name": "J. Doe", "room_number": "1204", "room_type": "King", "nights": 3,
+            "check_in": "2024-02-27", "check_out": "2024-03-01", "room_rate": 189.0,
+        },
+        "additional_info": {"return_policy": None, "notes": "Thank you for staying with us"},
+    }
+
+
+def render_script(receipt, repeats, root):
+    """AppTest script: render the receipt `repeats` times into one placeholder, timing each render."""
+    import sys
+    import time
+
+    sys.path.insert(0, root)
+    import streamlit as st
+    from ri_system.render import display_results
+
+    placeholder = st.empty()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        with placeholder.container():
+            display_results(receipt)
+        timings.append(time.perf_counter() - started)
+    st.session_state["timings"] = timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    build_items_table(synthetic_folio(10))  # warm up pandas
+    results = []
+    for n_items in args.items:
+        receipt = synthetic_folio(n_items)
+        started = time.perf_counter()
+        build_items_table(receipt)
+        table_ms = (time.perf_counter() - started) * 1000
+
+        at = AppTest.from_function(render_script, args=(receipt, args.repeats, ROOT), default_timeout=120)
+        at.run()
+        if at.exception:
+            raise SystemExit(at.exception[0].message)
+        render_ms = statistics.median(at.session_state["timings"]) * 1000
+        results.append({
+            "items": n_items,
+            "items_table_ms": round(table_ms, 2),
+            "render_ms": round(render_ms, 1),
+            "markdown_elements": len(at.markdown),
+        })
+        print(f"{n_items:5d} items: table {table_ms:7.2f} ms, render {render_ms:7.1f} ms, "
+              f"{len(at.markdown)} markdown elements")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
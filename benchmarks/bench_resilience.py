@@ -0,0 +1,140 @@
+"""Exercise the retry, circuit breaker and AIMD layer against a fault-injecting fake API.
+
+The fake accepts a limited number of concurrent calls and answers the rest
+with 429 (plus a RetryInfo hint), fails a share of calls with 503, and can be
+switched into a full outage. No API key or network is needed. Each scenario
+prints its outcome; tests/test_resilience.py checks the same behaviour
+deterministically.
+
+    python benchmarks/bench_resilience.py --calls 400 --workers 16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors  # noqa: E402
+
+from ri_system.batch import run_concurrently  # noqa: E402
+from ri_system.resilience import AIMDLimiter, CircuitBreaker, CircuitOpenError, Resilience  # noqa: E402
+
+
+def api_error(cls, code, status, retry_delay=None):
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}] if retry_delay else []
+    return cls(code, {"error": {"code": code, "status": status, "message": status, "details": details}})
+
+
+class FaultyAPI:
+    """Fake generate_content with a concurrency quota, random 503s and switchable outages."""
+
+    def __init__(self, capacity=6, error_rate=0.1, latency=0.02, seed=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.latency = latency
+        self.down = False
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.calls = 0
+        self.peak = 0
+
+    def generate_content(self, job):
+        with self._lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.peak = max(self.peak, self._in_flight)
+            over_quota = self._in_flight > self.capacity
+            flaky = self._rng.random() < self.error_rate
+        try:
+            time.sleep(self.latency)
+            if job == "bad-request":
+                raise api_error(errors.ClientError, 400, "INVALID_ARGUMENT")
+            if self.down:
+                raise api_error(errors.ServerError, 503, "UNAVAILABLE")
+            if over_quota:
+                raise api_error(errors.ClientError, 429, "RESOURCE_EXHAUSTED", "0.05s")
+            if flaky:
+                raise api_error(errors.ServerError, 503, "UNAVAILABLE")
+            return f"ok:{job}"
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def run(api, resilience, jobs, workers):
+    outcomes = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+    for _, result, _ in run_concurrently(jobs, lambda job: resilience.call(api.generate_content, job), workers):
+        outcomes["failed" if isinstance(result, Exception) else "ok"] += 1
+    return {
+        **outcomes,
+        "api_calls": api.calls,
+        "peak_in_flight": api.peak,
+        "seconds": round(time.perf_counter() - started, 2),
+        **resilience.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=6, help="Concurrent calls the fake API accepts")
+    args = parser.parse_args()
+    jobs = [f"receipt-{i}" for i in range(args.calls)]
+
+    def policy(minimum=1, **kwargs):
+        return Resilience(
+            base_delay=0.01, max_delay=0.5, rng=random.Random(1),
+            limiter=AIMDLimiter(initial=args.workers, minimum=minimum, maximum=args.workers, cooldown=0.1),
+            **kwargs
+        )
+
+    # No retries, no breaker, fixed concurrency: what the app did before
+    naive = run(
+        FaultyAPI(args.capacity),
+        policy(minimum=args.workers, max_attempts=1, breaker=CircuitBreaker(threshold=10 ** 9)),
+        jobs,
+        args.workers
+    )
+    print("no retries:     ", naive)
+
+    resilient = run(FaultyAPI(args.capacity), policy(), jobs, args.workers)
+    print("resilient:      ", resilient)
+
+    api = FaultyAPI(args.capacity, error_rate=0)
+    resilience = policy()
+    try:
+        resilience.call(api.generate_content, "bad-request")
+    except errors.ClientError:
+        pass
+    fatal = {"api_calls": api.calls, "retries": resilience.retries}
+    print("fatal error:    ", fatal)
+
+    # Outage: the breaker opens, calls fail fast, then a probe closes it again once the API is back
+    api = FaultyAPI(args.capacity, error_rate=0)
+    api.down = True
+    resilience = policy(breaker=CircuitBreaker(threshold=5, reset_after=0.3), max_attempts=2)
+    during = run(api, resilience, jobs[:50], 4)
+    calls_during_outage = api.calls
+    fast_failures = 0
+    try:
+        resilience.call(api.generate_content, "probe")
+    except CircuitOpenError:
+        fast_failures += 1
+    api.down = False
+    time.sleep(0.35)
+    after = run(api, resilience, jobs[:50], 4)
+    outage = {"failed": during["failed"], "api_calls": calls_during_outage, "fast_failures": fast_failures,
+              "circuit_after": after["circuit"], "ok_after": after["ok"]}
+    print("outage:         ", outage)
+    print(json.dumps({"no_retries": naive, "resilient": resilient, "fatal": fatal, "outage": outage}))
+
+
+if __name__ == "__main__":
+    main()
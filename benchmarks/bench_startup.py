@@ -0,0 +1,103 @@
+"""Cold-start cost of the app: time to the first rendered page, and what it imported.
+
+Each repeat starts two fresh interpreters under `python -X importtime` and
+renders the landing page once through Streamlit's AppTest harness:
+
+- with `RI_WARMUP=0`: the wall time of that first script run, imports
+  included (Streamlit itself is already loaded, as it is in a server that
+  just started), and which heavy modules (google.genai, pandas, PIL) it
+  imported and how long they took
+- with the warm-up on: the time until the background warm-up has finished
+  and the first analysis no longer waits for imports
+
+No API key or network needed.
+
+    python benchmarks/bench_startup.py --repeats 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("google.genai", "pandas", "PIL.Image")
+
+CHILD = """
+import json, sys, threading, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file({app!r}, default_timeout=120)
+started = time.perf_counter()
+at.run()
+first_render = time.perf_counter() - started
+loaded = [m for m in {heavy!r} if m in sys.modules]
+for thread in threading.enumerate():
+    if thread.name == "warm-up":
+        thread.join()
+ready = time.perf_counter() - started
+print(json.dumps({{"first_render": first_render, "ready": ready, "loaded": loaded,
+                  "exception": [e.message for e in at.exception]}}))
+"""
+
+
+def import_times(stderr):
+    """Cumulative import time in ms of each heavy module, from `-X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if name in HEAVY_MODULES and cumulative.isdigit():
+            times[name] = int(cumulative) / 1000
+    return times
+
+
+def cold_start(data_dir, warm_up):
+    env = dict(os.environ, RI_DATA_DIR=data_dir, RI_CACHE_DIR=data_dir, RI_WARMUP="1" if warm_up else "0")
+    code = CHILD.format(root=ROOT, app=os.path.join(ROOT, "app.py"), heavy=HEAVY_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, cwd=ROOT
+    )
+    if proc.returncode:
+        raise SystemExit(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if result["exception"]:
+        raise SystemExit(result["exception"][0])
+    result["imports_ms"] = import_times(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--data-dir", help="RI_DATA_DIR/RI_CACHE_DIR for the runs (default: a temporary directory)")
+    args = parser.parse_args()
+    if not args.data_dir:
+        args.data_dir = tempfile.mkdtemp(prefix="ri-startup-")
+
+    runs, warm_runs = [], []
+    for _ in range(args.repeats):
+        runs.append(cold_start(args.data_dir, warm_up=False))
+        warm_runs.append(cold_start(args.data_dir, warm_up=True))
+    summary = {
+        "first_render_ms": round(statistics.median(r["first_render"] for r in runs) * 1000, 1),
+        "ready_ms": round(statistics.median(r["ready"] for r in warm_runs) * 1000, 1),
+        "loaded_by_first_render": runs[-1]["loaded"],
+        "imports_ms": {
+            name: round(statistics.median(r["imports_ms"].get(name, 0) for r in runs), 1) for name in HEAVY_MODULES
+        },
+    }
+    print(f"first render {summary['first_render_ms']:.0f} ms, ready {summary['ready_ms']:.0f} ms "
+          f"(median of {args.repeats} cold starts)")
+    for name, ms in summary["imports_ms"].items():
+        needed = "needed" if name in summary["loaded_by_first_render"] else "not needed"
+        print(f"  {name:<14} {ms:7.1f} ms  ({needed} for the first render)")
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
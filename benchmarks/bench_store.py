@@ -0,0 +1,107 @@
+"""Report insert throughput and query latency of the receipt store.
+
+Fills a temporary store with synthetic receipts (no API key or network
+needed) in batched transactions, then times typical spend questions.
+
+    python benchmarks/bench_store.py --receipts 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ri_system.store import ReceiptStore  # noqa: E402
+
+MERCHANTS = [f"Merchant {i:04d}" for i in range(2000)] + ["Fresh Mart", "Fresh Market", "Fuel Stop"]
+BILL_TYPES = ["Retail", "Restaurant", "Grocery", "Utility", "Gas Station", "Hotel"]
+CURRENCIES = ["USD", "EUR", "SAR"]
+
+
+def synthetic_receipt(rng, start=date(2022, 1, 1)):
+    items = [
+        {
+            "item_name": f"Item {rng.randint(1, 5000)}",
+            "category": rng.choice(["Food", "Household", "Fuel", "Service"]),
+            "quantity": rng.randint(1, 4),
+            "unit_price": round(rng.uniform(0.5, 80), 2),
+        }
+        for _ in range(rng.randint(1, 8))
+    ]
+    for item in items:
+        item["total_price"] = round(item["quantity"] * item["unit_price"], 2)
+    subtotal = round(sum(i["total_price"] for i in items), 2)
+    tax = round(subtotal * 0.15, 2)
+    return {
+        "bill_type": rng.choice(BILL_TYPES),
+        "merchant_info": {"name": rng.choice(MERCHANTS)},
+        "transaction_info": {"date": (start + timedelta(days=rng.randint(0, 1095))).strftime("%m/%d/%Y")},
+        "items": items,
+        "pricing": {
+            "subtotal": subtotal,
+            "taxes": [{"tax_name": "VAT", "tax_rate": "15%", "tax_amount": tax}],
+            "total_tax": tax,
+            "total_amount": round(subtotal + tax, 2),
+            "currency": rng.choice(CURRENCIES),
+        },
+        "payment": {"method": rng.choice(["Cash", "Credit Card"])},
+    }
+
+
+QUERIES = {
+    "merchant, last quarter": dict(merchant="fresh mart", date_from="2024-10-01", date_to="2024-12-31"),
+    "merchant prefix": dict(merchant="fresh"),
+    "bill type, one month": dict(bill_type="Utility", date_from="2024-03-01", date_to="2024-03-31"),
+    "total over 500": dict(min_total=500),
+    "date range, one week": dict(date_from="2023-06-01", date_to="2023-06-07"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1000, help="Receipts per insert transaction")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReceiptStore(os.path.join(tmp, "receipts.sqlite3"))
+        started = time.perf_counter()
+        for offset in range(0, args.receipts, args.batch):
+            n = min(args.batch, args.receipts - offset)
+            store.add_many([(synthetic_receipt(rng), f"hash-{offset + i}", None) for i in range(n)])
+        insert_seconds = time.perf_counter() - started
+        print(f"inserted {args.receipts:,} receipts in {insert_seconds:.1f}s "
+              f"({args.receipts / insert_seconds:,.0f}/s, batches of {args.batch})")
+
+        results = []
+        print(f"{'query':<26} {'rows':>6} {'query ms':>9} {'summary ms':>11}")
+        for label, filters in QUERIES.items():
+            query_ms, summary_ms = [], []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                rows = store.query(**filters)
+                query_ms.append((time.perf_counter() - t) * 1000)
+                t = time.perf_counter()
+                store.summary(**filters)
+                summary_ms.append((time.perf_counter() - t) * 1000)
+            results.append({
+                "query": label,
+                "rows": len(rows),
+                "query_ms": round(statistics.median(query_ms), 2),
+                "summary_ms": round(statistics.median(summary_ms), 2),
+            })
+            r = results[-1]
+            print(f"{label:<26} {r['rows']:>6} {r['query_ms']:>9} {r['summary_ms']:>11}")
+        print(json.dumps({"insert_per_s": round(args.receipts / insert_seconds), "queries": results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measure peak Python memory of the upload path with tracemalloc.
+
+Compares the original path (decode for preview, seek/read copy, base64 string,
+inline_data dict) with the current one (one shared buffer, preprocessing and a
+typed bytes part). Exits non-zero when the current path exceeds the documented
+limit of `upload size + 16 MB` per analysis.
+
+    python benchmarks/bench_upload_memory.py --megapixels 12 50
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from bench_preprocess import synthetic_receipt  # noqa: E402
+from ri_system.imaging import format_bytes, preprocess_image  # noqa: E402
+
+LIMIT_OVERHEAD = 16 * 1024 * 1024
+PROMPT = "x" * 8000  # roughly the size of SYSTEM_PROMPT
+
+
+def legacy_path(uploaded):
+    image = Image.open(uploaded)
+    preview = io.BytesIO()
+    image.save(preview, format="PNG")  # st.image re-encodes PIL images for the browser
+    uploaded.seek(0)
+    image_bytes = uploaded.read()
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    return [PROMPT, {"inline_data": {"mime_type": "image/jpeg", "data": image_base64}}], preview
+
+
+def current_path(uploaded):
+    image_bytes = uploaded.getvalue()
+    payload, mime_type, _ = preprocess_image(image_bytes, "image/jpeg")
+    return [PROMPT, types.Part.from_bytes(data=payload, mime_type=mime_type)], image_bytes
+
+
+def peak(path, data):
+    uploaded = io.BytesIO(data)  # stands in for Streamlit's UploadedFile
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = path(uploaded)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 50])
+    args = parser.parse_args()
+
+    results, over_limit = [], False
+    for mp in args.megapixels:
+        height = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+        data = synthetic_receipt(height * 3 // 4, height)
+        legacy, current = peak(legacy_path, data), peak(current_path, data)
+        limit = len(data) + LIMIT_OVERHEAD
+        over_limit |= current > limit
+        results.append({
+            "megapixels": mp,
+            "upload_bytes": len(data),
+            "legacy_peak_bytes": legacy,
+            "current_peak_bytes": current,
+            "limit_bytes": limit,
+        })
+        print(
+            f"{mp:>5} MP upload {format_bytes(len(data)):>9}: legacy peak {format_bytes(legacy):>9}, "
+            f"current peak {format_bytes(current):>9} (limit {format_bytes(limit)})"
+        )
+    print(json.dumps(results))
+    sys.exit(1 if over_limit else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""Load test: concurrent browser sessions against one `streamlit run app.py` server.
+
+Streamlit's AppTest runs one session per process (each run swaps a global
+runtime in and out), so it can't show how sessions contend inside one
+server. This script starts the real app on a local port for each
+concurrency level, with the model replaced by a `ReplayBackend` answering
+after `--latency` seconds, and connects that many headless sessions that
+speak Streamlit's websocket protocol the way the browser does:
+
+1. open the page (the first script run) and enter an API key
+2. upload a receipt photo: ask for an upload URL, PUT the file, rerun with
+   the uploader's new state, and fetch the preview image
+3. click Analyze and follow the job fragment's auto-reruns until the result
+   (or an error) is shown
+4. expand the result sections. Expanders open in the browser without a
+   rerun, so the session checks every section arrived and then reruns the
+   script `--browse` times, which any other widget interaction would cost
+
+Each session uploads `--receipts` different photos (never a cache hit).
+Per level it reports the p50/p95/p99 latency of a script run, from the
+message sent to `script_finished` (full runs and fragment runs together,
+plus full runs only), the time from clicking Analyze to the result,
+analyses and script runs per second, and the server process's CPU (cores
+busy, with the simulated browsers' own share next to it) and peak RSS.
+`--slo-ms` names the highest level whose p95 stays under it. Exits non-zero
+if the app raised an exception or a session failed.
+
+The rate limits are turned off (`RI_RPM=0`, `RI_TPM=0`) unless set in the
+environment. No API key or network needed.
+
+    python benchmarks/loadtest.py --sessions 1 4 8 16 32 --latency 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.Common_pb2 import FileUploaderState, UploadedFileInfo  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+
+from bench_preprocess import synthetic_receipt  # noqa: E402
+from bench_render import synthetic_folio  # noqa: E402
+
+# ScriptFinishedStatus values that end a run; FINISHED_EARLY_FOR_RERUN means another run follows
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+API_KEY_LABEL = "🔑 Google API Key"
+ANALYZE_LABEL = "✨ Analyze"
+# Alerts that end an analysis, by format: the success notice or an error
+DONE_ALERTS = ("SUCCESS", "ERROR")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class SessionFailed(RuntimeError):
+    """The app did not respond as a browser would expect."""
+
+
+class Session:
+    """One headless browser tab: a websocket, the page's current elements and the widget values it sends."""
+
+    def __init__(self, base_url, http, timeout):
+        self.base_url = base_url
+        self.http = http
+        self.timeout = timeout
+        self.session_id = None
+        self.page_script_hash = ""
+        self.elements = {}  # delta path -> (kind, payload)
+        self.auto_reruns = {}  # fragment id -> interval
+        self.widget_states = {}  # widget id -> WidgetState sent with every rerun
+        self.fetched = set()
+        self.runs = []  # (kind, seconds)
+        self.exceptions = []
+        self._finished = None
+        self._file_urls = {}
+
+    async def open(self):
+        self.ws = await websockets.connect(
+            self.base_url.replace("http", "ws", 1) + "/_stcore/stream",
+            subprotocols=["streamlit"], max_size=None,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def close(self):
+        self._reader.cancel()
+        await self.ws.close()
+
+    async def _read(self):
+        async for data in self.ws:
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                if msg.new_session.HasField("initialize"):
+                    self.session_id = msg.new_session.initialize.session_id
+                self.page_script_hash = msg.new_session.page_script_hash
+                if not msg.new_session.fragment_ids_this_run:
+                    # A full run redraws the page and registers its auto-reruns again
+                    self.elements.clear()
+                    self.auto_reruns.clear()
+            elif kind == "delta":
+                self._on_delta(tuple(msg.metadata.delta_path), msg.delta)
+            elif kind == "auto_rerun":
+                self.auto_reruns[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == "file_urls_response":
+                self._file_urls.pop(msg.file_urls_response.response_id).set_result(msg.file_urls_response)
+            elif kind == "script_finished" and msg.script_finished in FINISHED:
+                if self._finished is not None and not self._finished.done():
+                    self._finished.set_result(None)
+
+    def _on_delta(self, path, delta):
+        if delta.HasField("add_block"):
+            block = delta.add_block
+            if block.HasField("expandable"):
+                self.elements[path] = ("expander", block.expandable.label)
+            return
+        if not delta.HasField("new_element"):
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind == "alert":
+            self.elements[path] = ("alert", (element.alert.Format.Name(element.alert.format), element.alert.body))
+        elif kind in ("button", "text_input", "file_uploader"):
+            widget = getattr(element, kind)
+            self.elements[path] = (kind, (widget.label, widget.id))
+        elif kind == "imgs":
+            self.elements[path] = ("imgs", [image.url for image in element.imgs.imgs])
+        elif kind == "exception":
+            self.exceptions.append(element.exception.message)
+            self.elements[path] = ("exception", element.exception.message)
+        else:
+            self.elements.pop(path, None)
+
+    def find(self, kind):
+        return [payload for k, payload in self.elements.values() if k == kind]
+
+    def widget_id(self, kind, label_prefix):
+        for label, widget_id in self.find(kind):
+            if label.startswith(label_prefix):
+                return widget_id
+        raise SessionFailed(f"no {kind} labelled {label_prefix!r} on the page")
+
+    async def rerun(self, kind="full", fragment_id=None, trigger=None):
+        """Send a rerun with the current widget values (plus a button press) and wait for it to finish."""
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.page_script_hash = self.page_script_hash
+        state.widget_states.widgets.extend(self.widget_states.values())
+        if trigger:
+            state.widget_states.widgets.append(WidgetState(id=trigger, trigger_value=True))
+        if fragment_id:
+            state.fragment_id = fragment_id
+            state.is_auto_rerun = True
+        self._finished = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        try:
+            await asyncio.wait_for(self._finished, self.timeout)
+        except asyncio.TimeoutError:
+            raise SessionFailed(f"{kind} run did not finish within {self.timeout:.0f}s") from None
+        self.runs.append((kind, time.perf_counter() - started))
+        await self.fetch_media()
+
+    async def fetch_media(self):
+        """Download images the page shows that this tab hasn't loaded yet, as the browser would."""
+        for urls in self.find("imgs"):
+            for url in urls:
+                if url not in self.fetched:
+                    self.fetched.add(url)
+                    await self.http.get(self.base_url + url)
+
+    async def upload(self, name, data, mime_type):
+        uploader = self.widget_id("file_uploader", "")
+        msg = BackMsg()
+        request_id = uuid.uuid4().hex
+        msg.file_urls_request.request_id = request_id
+        msg.file_urls_request.file_names.append(name)
+        msg.file_urls_request.session_id = self.session_id
+        self._file_urls[request_id] = asyncio.get_running_loop().create_future()
+        await self.ws.send(msg.SerializeToString())
+        urls = (await asyncio.wait_for(self._file_urls[request_id], self.timeout)).file_urls[0]
+        response = await self.http.put(self.base_url + urls.upload_url, files={"file": (name, data, mime_type)})
+        if response.status_code >= 400:
+            raise SessionFailed(f"upload refused with HTTP {response.status_code}")
+        self.widget_states[uploader] = WidgetState(id=uploader, file_uploader_state_value=FileUploaderState(
+            uploaded_file_info=[UploadedFileInfo(name=name, size=len(data), file_id=urls.file_id, file_urls=urls)]
+        ))
+        await self.rerun("upload")
+
+    def outcome(self):
+        for fmt, body in self.find("alert"):
+            if fmt in DONE_ALERTS and ("analyzed" in body or "Loaded" in body or body.startswith("❌")):
+                return fmt
+        return None
+
+    async def analyze(self):
+        """Click Analyze and follow the job's polling fragment until the result or an error is shown."""
+        started = time.perf_counter()
+        await self.rerun("click", trigger=self.widget_id("button", ANALYZE_LABEL))
+        deadline = started + self.timeout
+        while self.outcome() is None:
+            if time.perf_counter() > deadline:
+                raise SessionFailed(f"no result within {self.timeout:.0f}s")
+            if not self.auto_reruns:
+                raise SessionFailed("neither a result nor a running job on the page")
+            fragment_id, interval = next(iter(self.auto_reruns.items()))
+            await asyncio.sleep(interval)
+            await self.rerun("poll", fragment_id=fragment_id)
+        return self.outcome(), time.perf_counter() - started
+
+
+async def run_session(i, base_url, photos, args, results):
+    """Drive one simulated user through every step; records timings and failures into `results`."""
+    await asyncio.sleep(random.Random(i).uniform(0, args.ramp))
+    async with httpx.AsyncClient(timeout=args.timeout) as http:
+        session = Session(base_url, http, args.timeout)
+        try:
+            await session.open()
+            await session.rerun("open")
+            api_key = session.widget_id("text_input", API_KEY_LABEL)
+            session.widget_states[api_key] = WidgetState(id=api_key, string_value="load-test")
+            await session.rerun("api_key")
+            for name, data in photos:
+                await session.upload(name, data, "image/jpeg")
+                outcome, seconds = await session.analyze()
+                results["analyses"].append(seconds)
+                if outcome != "SUCCESS":
+                    results["failed_analyses"] += 1
+                if not session.find("expander"):
+                    raise SessionFailed("result shown without its sections")
+                for _ in range(args.browse):
+                    await session.rerun("browse")
+                await asyncio.sleep(args.think)
+        except (SessionFailed, OSError, websockets.WebSocketException, httpx.HTTPError) as e:
+            results["session_errors"].append(f"session {i}: {e}")
+        finally:
+            results["runs"].extend(session.runs)
+            results["exceptions"].extend(session.exceptions)
+            await session.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, replay_dir, data_dir, args):
+    env = dict(
+        os.environ,
+        RI_REPLAY_DIR=replay_dir,
+        RI_REPLAY_LATENCY=str(args.latency),
+        RI_DATA_DIR=data_dir,
+        RI_CACHE_DIR=data_dir,
+    )
+    env.setdefault("RI_RPM", "0")
+    env.setdefault("RI_TPM", "0")
+    log = open(os.path.join(data_dir, "server.log"), "wb")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "app.py"),
+         "--server.port", str(port), "--server.address", "127.0.0.1", "--server.headless", "true",
+         "--server.fileWatcherType", "none", "--server.enableXsrfProtection", "false",
+         "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"server exited; see {log.name}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise SystemExit("server did not become healthy within 60s")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        # utime and stime, after the parenthesised command name
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def new_results():
+    return {"runs": [], "analyses": [], "failed_analyses": 0, "session_errors": [], "exceptions": []}
+
+
+async def run_level(n, base_url, pid, photos, args):
+    results = new_results()
+    peak_rss = rss_bytes(pid)
+    cpu_before, client_cpu_before, started = cpu_seconds(pid), time.process_time(), time.perf_counter()
+    sessions = asyncio.gather(*(
+        run_session(i, base_url, photos[i * args.receipts:(i + 1) * args.receipts], args, results) for i in range(n)
+    ))
+    while not sessions.done():
+        peak_rss = max(peak_rss, rss_bytes(pid))
+        await asyncio.wait([sessions], timeout=0.2)
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds(pid) - cpu_before
+    client_cpu = time.process_time() - client_cpu_before
+
+    all_runs = [seconds for _, seconds in results["runs"]]
+    full_runs = [seconds for kind, seconds in results["runs"] if kind != "poll"]
+    return {
+        "sessions": n,
+        "script_runs": len(all_runs),
+        "run_p50_ms": round(quantile(all_runs, 0.5) * 1000, 1),
+        "run_p95_ms": round(quantile(all_runs, 0.95) * 1000, 1),
+        "run_p99_ms": round(quantile(all_runs, 0.99) * 1000, 1),
+        "full_run_p95_ms": round(quantile(full_runs, 0.95) * 1000, 1),
+        "analyze_p50_s": round(quantile(results["analyses"], 0.5), 2),
+        "analyze_p95_s": round(quantile(results["analyses"], 0.95), 2),
+        "analyses_per_s": round(len(results["analyses"]) / elapsed, 2),
+        "runs_per_s": round(len(all_runs) / elapsed, 1),
+        "cpu_cores": round(cpu / elapsed, 2),
+        # The simulated browsers' own share, on the same machine
+        "client_cpu_cores": round(client_cpu / elapsed, 2),
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+        "seconds": round(elapsed, 1),
+        "failed_analyses": results["failed_analyses"],
+        "session_errors": results["session_errors"],
+        "exceptions": sorted(set(results["exceptions"])),
+    }
+
+
+def describe(level):
+    line = (
+        f"{level['sessions']:>4} sessions: script run p50 {level['run_p50_ms']:>7.1f} ms, "
+        f"p95 {level['run_p95_ms']:>7.1f} ms, p99 {level['run_p99_ms']:>7.1f} ms "
+        f"(full runs p95 {level['full_run_p95_ms']:.1f} ms) · "
+        f"analyze p50 {level['analyze_p50_s']:.2f}s p95 {level['analyze_p95_s']:.2f}s · "
+        f"{level['analyses_per_s']:.2f} analyses/s, {level['runs_per_s']:.1f} runs/s · "
+        f"CPU {level['cpu_cores']:.2f} cores (clients {level['client_cpu_cores']:.2f}) · "
+        f"peak RSS {level['peak_rss_mb']:.0f} MB"
+    )
+    if level["session_errors"]:
+        line += f" · {len(level['session_errors'])} sessions failed"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8, 16], help="Concurrency levels")
+    parser.add_argument("--receipts", type=int, default=2, help="Receipts each session uploads and analyzes")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds the stand-in model takes per call")
+    parser.add_argument("--items", type=int, default=20, help="Line items in each replayed receipt")
+    parser.add_argument("--browse", type=int, default=3, help="Reruns while looking through each result")
+    parser.add_argument("--think", type=float, default=1.0, help="Seconds a user pauses between receipts")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Sessions start spread over this many seconds")
+    parser.add_argument("--photo-size", type=int, nargs=2, default=[900, 1200], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Seconds before a run or analysis counts as failed")
+    parser.add_argument("--slo-ms", type=float, help="p95 script-run latency target for the sizing line")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ri-loadtest-") as tmp:
+        replay_dir = os.path.join(tmp, "replay")
+        os.makedirs(replay_dir)
+        for seed in range(4):
+            with open(os.path.join(replay_dir, f"receipt-{seed}.json"), "w", encoding="utf-8") as f:
+                json.dump(synthetic_folio(args.items, seed=seed), f)
+        width, height = args.photo_size
+        photos = [
+            (f"receipt-{i}.jpg", synthetic_receipt(width, height, seed=i))
+            for i in range(max(args.sessions) * args.receipts)
+        ]
+
+        levels = []
+        for n in args.sessions:
+            data_dir = os.path.join(tmp, f"level-{n}")
+            os.makedirs(data_dir)
+            port = free_port()
+            server = start_server(port, replay_dir, data_dir, args)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                # One untimed session loads the app's modules and caches, as in a server that has been up a while
+                warm, warm_args = new_results(), argparse.Namespace(**{**vars(args), "ramp": 0, "think": 0})
+                warm_photo = ("warm-up.jpg", synthetic_receipt(width, height, seed=-1))
+                asyncio.run(run_session(0, base_url, [warm_photo], warm_args, warm))
+                if warm["session_errors"]:
+                    raise SystemExit(f"warm-up session failed: {warm['session_errors'][0]}")
+                level = asyncio.run(run_level(n, base_url, server.pid, photos, args))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            levels.append(level)
+            print(describe(level))
+            for error in level["session_errors"][:3] + level["exceptions"][:3]:
+                print(f"      {error}")
+
+    summary = {"levels": levels}
+    if args.slo_ms:
+        within = [level["sessions"] for level in levels if level["run_p95_ms"] <= args.slo_ms]
+        summary["max_sessions_within_slo"] = max(within) if within else 0
+        print(f"Highest level with script-run p95 under {args.slo_ms:g} ms: "
+              f"{summary['max_sessions_within_slo']} sessions")
+    print(json.dumps(summary))
+    return 1 if any(level["session_errors"] or level["exceptions"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
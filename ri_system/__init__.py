@@ -0,0 +1 @@
+"""Helpers shared by the Receipt Digitizer Streamlit app."""
@@ -0,0 +1,195 @@
+"""Model backends for extraction.
+
+`analyze_receipt()` talks to the model only through `backend.models`:
+
+- `generate_content(model=, contents=, config=)` returning a response with
+  `.text` and `.usage_metadata`
+- `generate_content_stream(...)` yielding such responses as chunks
+
+A `genai.Client` is the production backend. `ReplayBackend` answers from
+recorded JSON responses with configurable latency and injected failures, so
+the app, the batch CLI and the benchmarks run offline and measure our own
+overhead apart from Gemini's. `RecordingBackend` wraps a real client and
+saves its responses for later replay.
+
+Setting `RI_REPLAY_DIR` makes `clients.create_client` return a replay backend
+(`RI_REPLAY_LATENCY`, `RI_REPLAY_FAILURE_RATE` and `RI_REPLAY_THROTTLE_RATE`
+tune it); `RI_RECORD_DIR` records real responses into a directory.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+from .cache import hash_bytes
+from .schema import BILL_TYPES, BillTypeGuess
+
+# Roughly what Gemini bills for one image part
+IMAGE_TOKENS = 258
+
+
+def request_key(contents):
+    """Hash of the first image or document part in a request (None if it has none)."""
+    for item in contents:
+        for part in getattr(item, "parts", None) or [item]:
+            inline = getattr(part, "inline_data", None)
+            if inline is not None and inline.data:
+                return hash_bytes(inline.data)
+    return None
+
+
+def estimate_prompt_tokens(contents):
+    """Prompt tokens Gemini will bill for a request: one image's worth per image or document part, plus text."""
+    images = chars = 0
+    for item in contents:
+        for part in getattr(item, "parts", None) or [item]:
+            chars += len(getattr(part, "text", None) or "")
+            images += getattr(part, "inline_data", None) is not None
+    return images * IMAGE_TOKENS + chars // 4
+
+
+def make_response(text, prompt_tokens=0):
+    """A real SDK response object carrying `text`, with estimated token usage."""
+    from google.genai import types
+
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=len(text) // 4,
+            total_token_count=prompt_tokens + len(text) // 4,
+        ),
+    )
+
+
+class _ReplayModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content(self, model, contents, config=None):
+        text, prompt_tokens = self._backend.respond(contents, config)
+        return make_response(text, prompt_tokens)
+
+    def generate_content_stream(self, model, contents, config=None):
+        text, prompt_tokens = self._backend.respond(contents, config, stream=True)
+        size = self._backend.chunk_chars
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self._backend.latency / len(chunks))
+            # Usage is reported on the final chunk, as Gemini does
+            yield make_response(chunk, prompt_tokens if i == len(chunks) - 1 else 0)
+
+
+class ReplayBackend:
+    """Answers requests from recorded responses, keyed by the hash of the request's image.
+
+    Requests for images without a recording get one of the recordings, picked
+    deterministically from the image hash. `failure_rate` and `throttle_rate`
+    inject 503 and 429 errors; `latency` is the time to a full response.
+    """
+
+    def __init__(self, responses, latency=0.0, failure_rate=0.0, throttle_rate=0.0, chunk_chars=64, seed=0):
+        if not responses:
+            raise ValueError("ReplayBackend needs at least one recorded response")
+        self.responses = dict(responses)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.chunk_chars = chunk_chars
+        self.models = _ReplayModels(self)
+        self.calls = 0
+        self._fallback = [self.responses[key] for key in sorted(self.responses)]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dir(cls, path, **kwargs):
+        """Load `<image hash>.json` recordings from a directory."""
+        responses = {}
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".json"):
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    responses[name[:-len(".json")]] = f.read()
+        return cls(responses, **kwargs)
+
+    @classmethod
+    def from_env(cls):
+        return cls.from_dir(
+            os.environ["RI_REPLAY_DIR"],
+            latency=float(os.environ.get("RI_REPLAY_LATENCY", 0)),
+            failure_rate=float(os.environ.get("RI_REPLAY_FAILURE_RATE", 0)),
+            throttle_rate=float(os.environ.get("RI_REPLAY_THROTTLE_RATE", 0)),
+        )
+
+    def respond(self, contents, config=None, stream=False):
+        """Response text and prompt token estimate for a request, after latency and injected failures."""
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+        if not stream:
+            time.sleep(self.latency)
+        from google.genai import errors
+
+        if roll < self.throttle_rate:
+            raise errors.ClientError(429, {"error": {
+                "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Replay throttle",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}],
+            }})
+        if roll < self.throttle_rate + self.failure_rate:
+            raise errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "Replay failure"}})
+
+        key = request_key(contents)
+        text = self.responses.get(key)
+        if text is None:
+            text = self._fallback[int(key, 16) % len(self._fallback) if key else 0]
+        if getattr(config, "response_schema", None) is BillTypeGuess:
+            # Classify as the bill type of the recorded extraction
+            try:
+                bill_type = json.loads(text).get("bill_type")
+            except (ValueError, AttributeError):
+                bill_type = None
+            text = json.dumps({"bill_type": bill_type if bill_type in BILL_TYPES else "Other"})
+        return text, estimate_prompt_tokens(contents)
+
+    def close(self):
+        pass
+
+
+class _RecordingModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content(self, model, contents, config=None):
+        response = self._backend.client.models.generate_content(model=model, contents=contents, config=config)
+        self._backend.save(contents, config, response.text or "")
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        text = []
+        for chunk in self._backend.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            text.append(chunk.text or "")
+            yield chunk
+        self._backend.save(contents, config, "".join(text))
+
+
+class RecordingBackend:
+    """Wraps a backend and saves each extraction response as `<image hash>.json` for `ReplayBackend`."""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.models = _RecordingModels(self)
+        os.makedirs(path, exist_ok=True)
+
+    def save(self, contents, config, text):
+        key = request_key(contents)
+        # Classification answers aren't receipts; replay derives them from the extraction
+        if key is None or getattr(config, "response_schema", None) is BillTypeGuess:
+            return
+        with open(os.path.join(self.path, f"{key}.json"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def close(self):
+        self.client.close()
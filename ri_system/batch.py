@@ -0,0 +1,342 @@
+"""Concurrent analysis of many receipts at once.
+
+Also usable headless, without Streamlit, for scheduled ingestion:
+
+    python -m ri_system.batch scans/ --out results.jsonl --concurrency 8
+
+Results are appended as each receipt finishes, and a checkpoint file records
+every receipt that was written successfully, so an interrupted run resumes
+where it stopped. Failed receipts are not checkpointed and are retried on the
+next run.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import extraction
+from .cache import ResultCache, cache_version, hash_bytes
+from .clients import create_client
+from .dedupe import dhash
+from .imaging import PreprocessSettings, check_upload
+from .metrics import METRICS, setup_from_env
+from .pdf import CAN_SPLIT
+from .ratelimit import DEFAULT_RPM, DEFAULT_TPM, RateLimitedClient, RateLimiter
+from .resilience import AIMDLimiter, Resilience
+from .store import ReceiptStore
+from .usage import UsageStats
+
+DEFAULT_CONCURRENCY = 8
+# Ceiling for the batch page's concurrency setting and the app's shared limiter
+MAX_CONCURRENCY = 32
+
+
+def run_concurrently(jobs, fn, max_workers=DEFAULT_CONCURRENCY):
+    """Call `fn(job)` for every job with at most `max_workers` calls in flight.
+
+    Yields `(job, result, seconds)` in completion order, so callers can update
+    progress as each call finishes. `jobs` may be a lazy iterable; only a small
+    window of it is pulled ahead of the workers. Exceptions raised by `fn` are
+    yielded as the result instead of aborting the whole batch.
+    """
+    def timed(job):
+        start = time.perf_counter()
+        try:
+            result = fn(job)
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - start
+
+    max_workers = max(1, max_workers)
+    jobs = iter(jobs)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        try:
+            while True:
+                # Keep the queue topped up to twice the worker count
+                for job in jobs:
+                    pending[executor.submit(timed, job)] = job
+                    if len(pending) >= max_workers * 2:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, seconds = future.result()
+                    yield pending.pop(future), result, seconds
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def combine_results(named_results):
+    """Flatten `(file_name, receipt_data)` pairs into one item-level DataFrame.
+
+    Every line item becomes a row tagged with its receipt's file name, merchant,
+    date, bill type and currency. Receipts without items contribute a single
+    row carrying the receipt total.
+    """
+    rows = []
+    for file_name, data in named_results:
+        merchant = data.get("merchant_info", {}) or {}
+        transaction = data.get("transaction_info", {}) or {}
+        pricing = data.get("pricing", {}) or {}
+        receipt = {
+            "File": file_name,
+            "Merchant": merchant.get("name"),
+            "Date": transaction.get("date"),
+            "Bill Type": data.get("bill_type"),
+            "Currency": pricing.get("currency"),
+        }
+        items = data.get("items") or []
+        if not items:
+            rows.append({**receipt, "Receipt Total": pricing.get("total_amount")})
+            continue
+        for item in items:
+            rows.append({
+                **receipt,
+                "Item": item.get("item_name"),
+                "Category": item.get("category"),
+                "Qty": item.get("quantity"),
+                "Unit Price": item.get("unit_price"),
+                "Total": item.get("total_price"),
+                "Receipt Total": pricing.get("total_amount"),
+            })
+    import pandas as pd
+
+    return pd.DataFrame(rows)
+
+
+# ============================================
+# Headless CLI
+# ============================================
+
+def iter_receipt_files(root, recursive=True):
+    """Yield supported image and PDF paths under `root` lazily, in a stable order."""
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except NotADirectoryError:
+        yield root
+        return
+    for entry in entries:
+        if entry.is_dir():
+            if recursive:
+                yield from iter_receipt_files(entry.path, recursive)
+        elif entry.name.rsplit(".", 1)[-1].lower() in extraction.MIME_TYPES:
+            yield entry.path
+
+
+class Checkpoint:
+    """Append-only list of receipts already written to the output."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark(self, keys):
+        for key in keys:
+            self._file.write(key + "\n")
+            self.done.add(key)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlSink:
+    """Appends one JSON line per receipt; every row is durable once written."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        return [row["file"]] if row["status"] == "ok" else []
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+class ParquetSink:
+    """Writes rows to a Parquet dataset directory, one part file per flushed chunk."""
+
+    def __init__(self, path, chunk_size=500):
+        if importlib.util.find_spec("pyarrow") is None:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        self.path = path
+        self.chunk_size = chunk_size
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+        self._part = len([n for n in os.listdir(path) if n.endswith(".parquet")])
+
+    def write(self, row):
+        self._rows.append(row)
+        return self.flush() if len(self._rows) >= self.chunk_size else []
+
+    def flush(self):
+        if not self._rows:
+            return []
+        import pandas as pd
+
+        frame = pd.DataFrame(self._rows)
+        frame["data"] = frame["data"].map(lambda d: json.dumps(d, ensure_ascii=False) if d else None)
+        part_path = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        frame.to_parquet(part_path + ".tmp", index=False)
+        os.replace(part_path + ".tmp", part_path)
+        self._part += 1
+        keys = [r["file"] for r in self._rows if r["status"] == "ok"]
+        self._rows = []
+        return keys
+
+    def close(self):
+        return self.flush()
+
+
+def result_row(key, data, error, from_cache, seconds):
+    """Output record for one receipt."""
+    data = data or {}
+    pricing = data.get("pricing") or {}
+    return {
+        "file": key,
+        "status": "ok" if data and not error else "error",
+        "error": error,
+        "cached": from_cache,
+        "seconds": round(seconds, 3),
+        "bill_type": data.get("bill_type"),
+        "merchant": (data.get("merchant_info") or {}).get("name"),
+        "date": (data.get("transaction_info") or {}).get("date"),
+        "total": pricing.get("total_amount"),
+        "currency": pricing.get("currency"),
+        "data": data or None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ri_system.batch",
+        description="Extract receipts from a directory of images without the Streamlit UI.",
+    )
+    parser.add_argument("input", help="Directory (or single image) to process")
+    parser.add_argument("--out", default="results.jsonl",
+                        help="Output path; a .parquet path writes a Parquet dataset directory")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <out>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY") or os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key (default: $GOOGLE_API_KEY or $GEMINI_API_KEY)")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM, help="Requests per minute allowed (0: no limit)")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TPM, help="Prompt tokens per minute allowed (0: no limit)")
+    parser.add_argument("--two-stage", action="store_true", help="Classify bill type first and trim the prompt")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Start with the cheapest model, escalating receipts whose totals don't add up")
+    parser.add_argument("--split-tall", action="store_true",
+                        help="Read very tall receipt photos as overlapping tiles in parallel")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subdirectories")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send images without shrinking them")
+    parser.add_argument("--max-long-edge", type=int, default=2048)
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the shared result cache")
+    parser.add_argument("--store", nargs="?", const="", metavar="PATH",
+                        help="Also save receipts to the receipt store (default location if PATH is omitted)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        raise SystemExit("No API key: pass --api-key or set GOOGLE_API_KEY")
+
+    backend = create_client(args.api_key)
+    # Wait for quota instead of drawing 429s; the run is one owner, so its calls simply go in order
+    client = RateLimitedClient(backend, RateLimiter(args.rpm, args.tpm), owner="cli")
+    endpoint = setup_from_env()
+    if endpoint:
+        print(f"Metrics at {endpoint}", file=sys.stderr)
+    if not CAN_SPLIT:
+        print("pypdf is not installed: PDFs are sent whole instead of page by page "
+              "(pip install -r requirements.txt)", file=sys.stderr)
+    cache = None if args.no_cache else ResultCache(
+        version=cache_version(extraction.MODEL_NAME, extraction.SYSTEM_PROMPT)
+    )
+    usage = UsageStats()
+    # Throttling halves the in-flight requests; --concurrency stays the ceiling
+    resilience = Resilience(limiter=AIMDLimiter(initial=args.concurrency, maximum=args.concurrency))
+    store = None if args.store is None else ReceiptStore(args.store or None)
+    settings = PreprocessSettings(enabled=not args.no_preprocess, max_long_edge=args.max_long_edge)
+
+    sink = ParquetSink(args.out) if args.out.endswith(".parquet") else JsonlSink(args.out)
+    checkpoint = Checkpoint(args.checkpoint or args.out.rstrip("/") + ".checkpoint")
+    root = os.path.abspath(args.input)
+    base = root if os.path.isdir(root) else os.path.dirname(root)
+
+    def pending_files():
+        for path in iter_receipt_files(root, recursive=not args.no_recursive):
+            key = os.path.relpath(path, base)
+            if key not in checkpoint:
+                yield key, path
+
+    def analyze_file(job):
+        _, path = job
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        mime_type = extraction.get_mime_type(path)
+        check_upload(image_bytes, mime_type)
+        data, error, from_cache, _, _ = extraction.analyze_document(
+            image_bytes, mime_type, client, cache, two_stage=args.two_stage, usage=usage, resilience=resilience,
+            tiered=args.tiered, settings=settings, split_tall=args.split_tall
+        )
+        return data, error, from_cache, hash_bytes(image_bytes), dhash(image_bytes)
+
+    skipped = len(checkpoint.done)
+    ok = failed = 0
+    started = time.perf_counter()
+    try:
+        for (key, _), outcome, seconds in run_concurrently(pending_files(), analyze_file, args.concurrency):
+            if isinstance(outcome, Exception):
+                data, error, from_cache, image_hash, phash = None, str(outcome), False, None, None
+            else:
+                data, error, from_cache, image_hash, phash = outcome
+            row = result_row(key, data, error, from_cache, seconds)
+            # Store before checkpointing so a resumed run never leaves a receipt out
+            if store and row["status"] == "ok":
+                store.add(data, image_hash, key, phash)
+            checkpoint.mark(sink.write(row))
+            if row["status"] == "ok":
+                ok += 1
+            else:
+                failed += 1
+            print(f"[{ok + failed}] {row['status']:<5} {key} ({seconds:.1f}s){' ' + error if error else ''}",
+                  file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume.", file=sys.stderr)
+    finally:
+        checkpoint.mark(sink.close())
+        checkpoint.close()
+        backend.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done in {elapsed:.1f}s: {ok} ok, {failed} failed, {skipped} skipped from checkpoint",
+        file=sys.stderr,
+    )
+    for row in usage.summary() + usage.tiers():
+        print(f"  {row}", file=sys.stderr)
+    print(f"  {resilience.stats()}", file=sys.stderr)
+    for row in METRICS.summary():
+        print(f"  {row}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Content-addressed result cache for receipt extraction.
+
+Results are stored in a SQLite file keyed by a hash of the image bytes, the
+model name and the prompt, with a small in-memory LRU in front of it so
+repeat lookups in the same process never touch the disk.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "RI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ri-system")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB of stored JSON
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # 30 days
+DEFAULT_MEMORY_ITEMS = 128
+
+
+def hash_bytes(data):
+    """Return the hex SHA-256 digest of a bytes-like object."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(image_bytes, model, prompt):
+    """Build the cache key for an image analyzed by `model` with `prompt`."""
+    prompt_hash = hash_bytes(prompt.encode("utf-8"))
+    return hash_bytes(f"{hash_bytes(image_bytes)}:{model}:{prompt_hash}".encode("utf-8"))
+
+
+def cache_version(model, prompt):
+    """Fingerprint of the model/prompt pair; a change clears the cache."""
+    return f"{model}:{hash_bytes(prompt.encode('utf-8'))}"
+
+
+class ResultCache:
+    """SQLite-backed result cache with an in-memory LRU on top."""
+
+    def __init__(self, path=None, version="", max_bytes=DEFAULT_MAX_BYTES,
+                 max_age=DEFAULT_MAX_AGE, memory_items=DEFAULT_MEMORY_ITEMS):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "results.sqlite3")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+            )
+        self._check_version(version)
+        self._evict()
+
+    def _check_version(self, version):
+        """Drop every stored result when the model or prompt has changed."""
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row and row[0] == version:
+            return
+        with self._conn:
+            if row:
+                self._conn.execute("DELETE FROM results")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,)
+            )
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, image_bytes, model, prompt):
+        """Return the cached result for this image, or None on a miss."""
+        key = cache_key(image_bytes, model, prompt)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT data, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            with self._conn:
+                self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            data = json.loads(row[0])
+            self._remember(key, data)
+            self.hits += 1
+            return data
+
+    def put(self, image_bytes, model, prompt, data):
+        """Store a successful extraction result."""
+        key = cache_key(image_bytes, model, prompt)
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, data, size, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now, now),
+                )
+            self._remember(key, data)
+            self._evict()
+
+    def _evict(self):
+        """Remove expired entries, then the least recently used until under max_bytes."""
+        with self._conn:
+            self._conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM results ORDER BY accessed"
+            ).fetchall():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        """Drop every cached result and reset the counters."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM results")
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored entries."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
@@ -0,0 +1,149 @@
+"""Process-wide registry of reusable Gemini clients.
+
+Each `genai.Client` owns an HTTP connection pool, so keeping one client per
+API key lets every rerun and every session share warm connections instead of
+repeating client setup and TLS handshakes on each request.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .backends import RecordingBackend, ReplayBackend
+
+DEFAULT_MAX_CLIENTS = 16
+DEFAULT_IDLE_TIMEOUT = 30 * 60  # seconds
+
+
+def key_id(api_key):
+    """Stable, non-reversible identifier for an API key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def create_client(api_key):
+    """Build a new Gemini client for `api_key`.
+
+    `RI_REPLAY_DIR` swaps in a replay backend; `RI_RECORD_DIR` records the real client's responses there.
+    """
+    if os.environ.get("RI_REPLAY_DIR"):
+        return ReplayBackend.from_env()
+    from google import genai
+
+    client = genai.Client(api_key=api_key)
+    if os.environ.get("RI_RECORD_DIR"):
+        return RecordingBackend(client, os.environ["RI_RECORD_DIR"])
+    return client
+
+
+class ClientPool:
+    """Bounded LRU of clients keyed by API key hash, closing clients on eviction.
+
+    A client handed out by `acquire` is never closed under its user: evicting
+    it only drops it from the pool, and it closes once the last user releases it.
+    """
+
+    def __init__(self, factory=create_client, max_clients=DEFAULT_MAX_CLIENTS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.factory = factory
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.evicted = 0
+        self._clients = OrderedDict()  # key id -> (client, last used)
+        self._users = {}  # id(client) -> calls holding it between acquire() and release()
+        self._retired = {}  # id(client) -> client evicted while still in use
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        """Return the shared client for `api_key`, creating it on first use.
+
+        Eviction may close it later; hold it across a long run with `acquire` or `lease`.
+        """
+        with self._lock:
+            return self._get(api_key)
+
+    def acquire(self, api_key):
+        """Return the client for `api_key`, kept open until a matching `release()` even if it is evicted."""
+        with self._lock:
+            client = self._get(api_key)
+            if client is not None:
+                self._users[id(client)] = self._users.get(id(client), 0) + 1
+            return client
+
+    def release(self, client):
+        """Give back a client from `acquire()`; an evicted client is closed by its last user's release."""
+        with self._lock:
+            users = self._users.pop(id(client), 0) - 1
+            if users > 0:
+                self._users[id(client)] = users
+                return
+            if self._retired.pop(id(client), None) is not None:
+                self._close(client)
+                return
+            # Idle from now on, not from its last get()
+            for kid, (pooled, _) in self._clients.items():
+                if pooled is client:
+                    self._clients[kid] = (client, time.monotonic())
+                    break
+
+    @contextmanager
+    def lease(self, api_key):
+        """`acquire()` the client for `api_key` for the duration of a `with` block."""
+        client = self.acquire(api_key)
+        try:
+            yield client
+        finally:
+            if client is not None:
+                self.release(client)
+
+    def _get(self, api_key):
+        if not api_key:
+            return None
+        kid = key_id(api_key)
+        now = time.monotonic()
+        self._evict_idle(now)
+        if kid in self._clients:
+            client, _ = self._clients[kid]
+            self._clients[kid] = (client, now)
+            self._clients.move_to_end(kid)
+            return client
+
+        client = self.factory(api_key)
+        self.created += 1
+        self._clients[kid] = (client, now)
+        while len(self._clients) > self.max_clients:
+            self._evict(next(iter(self._clients)))
+        return client
+
+    def _evict_idle(self, now):
+        for kid, (client, last_used) in list(self._clients.items()):
+            # A client in use isn't idle, however long ago it was handed out
+            if now - last_used > self.idle_timeout and not self._users.get(id(client)):
+                self._evict(kid)
+
+    def _evict(self, kid):
+        client, _ = self._clients.pop(kid)
+        if self._users.get(id(client)):
+            # Still in use by a batch or a queued job: its last release() closes it
+            self._retired[id(client)] = client
+        else:
+            self._close(client)
+
+    def _close(self, client):
+        self.evicted += 1
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close and forget every pooled client."""
+        with self._lock:
+            while self._clients:
+                _, (client, _) = self._clients.popitem(last=False)
+                self._close(client)
+
+    def __len__(self):
+        return len(self._clients)
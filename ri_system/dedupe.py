@@ -0,0 +1,132 @@
+"""Near-duplicate detection for receipt images.
+
+A difference hash (dHash) survives re-photographing, recompression, resizing
+and light cropping far better than a byte hash, so a receipt uploaded twice
+can reuse the earlier result instead of being extracted and expensed again.
+
+Receipts all look alike at the usual 8x8 hash size (a pale strip of paper),
+so the hash is taken over the printed area only, at 16x16 (256 bits).
+Lookups use a multi-index hash table: the hash is split into 16-bit bands,
+and only receipts sharing at least one band are compared bit by bit.
+"""
+import io
+import threading
+from collections import defaultdict
+
+from PIL import Image, ImageOps
+
+HASH_SIZE = 16
+# Bits (of 256) two hashes may differ by and still count as the same receipt
+MAX_DISTANCE = 32
+# Pixels darker than this (after contrast stretching) count as print when finding the printed area
+INK_LEVEL = 110
+# Blank or nearly uniform images hash to (almost) all zeros and would all match each other
+MIN_DETAIL_BITS = 16
+
+
+def dhash(image_bytes, size=HASH_SIZE):
+    """Difference hash of the printed area of an image as a hex string.
+
+    Returns None when the image can't be decoded or has too little detail to compare.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # A small target lets libjpeg decode at 1/4 or 1/8 scale
+            image.draft("L", (256, 256))
+            image = ImageOps.exif_transpose(image).convert("L")
+    except (OSError, ValueError):
+        return None
+    image.thumbnail((256, 256))
+    image = ImageOps.autocontrast(image, cutoff=2)
+    # Crop to the printed area so borders, background and light cropping don't move the hash
+    box = image.point(lambda p: 255 if p < INK_LEVEL else 0).getbbox()
+    if box:
+        image = image.crop(box)
+    pixels = image.resize((size + 1, size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            value = (value << 1) | (pixels[i] > pixels[i + 1])
+    if bin(value).count("1") < MIN_DETAIL_BITS:
+        return None
+    return f"{value:0{size * size // 4}x}"
+
+
+def hamming(a, b):
+    """Number of differing bits between two hex hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class HashIndex:
+    """Multi-index hash table for Hamming-distance lookups.
+
+    Near-duplicates almost always share at least one 16-bit band exactly, so a
+    lookup only compares against the few stored hashes in the query's buckets.
+    This is approximate: a match differing in every band is missed.
+    """
+
+    def __init__(self, bits=HASH_SIZE * HASH_SIZE, band_bits=16):
+        self.band_bits = band_bits
+        self.bands = bits // band_bits
+        self._mask = (1 << band_bits) - 1
+        self._tables = defaultdict(lambda: defaultdict(list))
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _bands(self, value):
+        for band in range(self.bands):
+            yield band, (value >> (band * self.band_bits)) & self._mask
+
+    def add(self, phash, item):
+        value = int(phash, 16)
+        self._hashes[item] = value
+        for band, key in self._bands(value):
+            self._tables[band][key].append(item)
+
+    def search(self, phash, max_distance):
+        """All `(distance, item)` within `max_distance` bits, closest first."""
+        value = int(phash, 16)
+        candidates = set()
+        for band, key in self._bands(value):
+            candidates.update(self._tables[band].get(key, ()))
+        matches = []
+        for item in candidates:
+            distance = bin(self._hashes[item] ^ value).count("1")
+            if distance <= max_distance:
+                matches.append((distance, item))
+        return sorted(matches, key=lambda m: m[0])
+
+
+class DuplicateIndex:
+    """Hash index of stored receipts, loaded from the store on first use."""
+
+    def __init__(self, store, max_distance=MAX_DISTANCE):
+        self.store = store
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _loaded(self):
+        if self._index is None:
+            self._index = HashIndex()
+            for receipt_id, phash in self.store.phashes():
+                self._index.add(phash, receipt_id)
+        return self._index
+
+    def add(self, receipt_id, phash):
+        if phash:
+            with self._lock:
+                self._loaded().add(phash, receipt_id)
+
+    def find(self, phash):
+        """Closest stored receipt as `(receipt_id, distance)`, or None."""
+        with self._lock:
+            matches = self._loaded().search(phash, self.max_distance)
+        for distance, receipt_id in matches:
+            # Receipts replaced since they were indexed are gone from the store
+            if self.store.exists(receipt_id):
+                return receipt_id, distance
+        return None
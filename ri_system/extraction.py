@@ -0,0 +1,406 @@
+"""Receipt extraction with Gemini, independent of the Streamlit UI.
+
+Everything needed to turn image bytes into validated receipt data lives here,
+so the app and the headless batch CLI share the same prompt, schema and model
+calls. `google.genai` is imported by the functions that build requests rather
+than at module level: it takes about half a second to import, which the app's
+first page shouldn't wait for.
+"""
+import time
+from functools import lru_cache
+
+from .imaging import PreprocessSettings, preprocess_image
+from .jsonstream import StreamingJSON, strip_fences
+from .metrics import METRICS
+from .pdf import PDF_MIME, extract_pages, split_pages
+from .resilience import Resilience
+from .schema import (
+    BILL_TYPES, BillTypeGuess, ReceiptValidationError, parse_receipt, receipt_model, schema_outline, sections_for
+)
+from .tiles import is_tall, merge_tiles, split_tiles
+from .usage import add_usage
+from .validation import escalation_reasons, reconcile
+
+# Upload formats and the MIME type sent to Gemini for each
+MIME_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "pdf": PDF_MIME,
+}
+
+
+def get_mime_type(file_name):
+    """Map an uploaded file name to the MIME type sent to Gemini."""
+    file_extension = file_name.split(".")[-1].lower()
+    return MIME_TYPES.get(file_extension, "image/jpeg")
+
+
+# System prompt for Gemini (the JSON outline is generated from the receipt schema)
+@lru_cache(maxsize=None)
+def build_system_prompt(sections=None):
+    """System prompt asking for the given receipt sections (all of them by default)."""
+    return f"""
+You are an expert bill and receipt analyzer. You can analyze ANY type of bill, receipt, or invoice including but not limited to:
+- Retail/Shopping receipts
+- Restaurant/Food bills
+- Grocery store receipts
+- Utility bills (electricity, water, gas, internet)
+- Medical/Healthcare bills
+- Hotel/Accommodation invoices
+- Gas/Fuel station receipts
+- Transportation receipts (taxi, airline, train)
+- Subscription/Service invoices
+- Bank statements
+- Parking receipts
+- E-commerce order confirmations
+
+Analyze the uploaded image and extract ALL visible information comprehensively.
+
+Return the data STRICTLY as a valid JSON object with the following structure:
+{schema_outline(sections)}
+
+Important Instructions:
+- Return ONLY the JSON object, no additional text or markdown formatting
+- Only include sections that are relevant to the bill type (e.g., skip hotel_details for a grocery receipt)
+- If a field is not visible or unclear, use null
+- For items, extract as many details as possible from the image
+- Ensure all numeric values are actual numbers, not strings
+- Be thorough - extract EVERY piece of visible text that could be useful
+- Identify the correct bill_type based on the content
+- For non-English receipts, translate key fields to English but keep original values in notes if helpful
+"""
+
+
+SYSTEM_PROMPT = build_system_prompt()
+
+# Gemini model used for extraction
+MODEL_NAME = "gemini-2.5-flash"
+# Tiered mode: cheapest first, escalating while the result doesn't reconcile (see validation.py)
+MODEL_TIERS = ("gemini-2.5-flash-lite", MODEL_NAME, "gemini-2.5-pro")
+
+# Cheap first pass of the two-stage mode: classify the bill on a small image with a cheaper model
+CLASSIFIER_MODEL = "gemini-2.5-flash-lite"
+CLASSIFY_PROMPT = (
+    "Identify the type of this bill, receipt or invoice. Return JSON with a single "
+    f"\"bill_type\" field set to one of: {', '.join(BILL_TYPES)}."
+)
+CLASSIFY_IMAGE = PreprocessSettings(max_long_edge=512, quality=70)
+
+
+@lru_cache(maxsize=None)
+def classify_config():
+    """Constrain the classifier's response to a bill type."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=BillTypeGuess
+    )
+
+
+@lru_cache(maxsize=None)
+def generation_config(sections=None):
+    """Constrain the response to JSON matching the (possibly trimmed) receipt schema."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=receipt_model(sections)
+    )
+
+
+# Used when callers don't share their own instance
+DEFAULT_RESILIENCE = Resilience()
+
+
+def build_contents(image_bytes, mime_type, prompt=SYSTEM_PROMPT):
+    """Prompt plus the image as a typed part (raw bytes, no base64 copy on our side)."""
+    from google.genai import types
+
+    return [
+        types.Part.from_text(text=prompt),
+        types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+    ]
+
+
+def classify_bill_type(client, image_bytes, mime_type, totals, cache=None, resilience=DEFAULT_RESILIENCE):
+    """Guess the bill type with a cheap call (or a cached guess); None if unsure."""
+    if not mime_type.startswith("image/"):
+        return None
+    small, small_mime, _ = preprocess_image(image_bytes, mime_type, CLASSIFY_IMAGE)
+    cached = cache.get(small, CLASSIFIER_MODEL, CLASSIFY_PROMPT) if cache else None
+    if cached is not None:
+        return cached["bill_type"]
+
+    try:
+        response = resilience.call(
+            client.models.generate_content,
+            model=CLASSIFIER_MODEL,
+            contents=build_contents(small, small_mime, CLASSIFY_PROMPT),
+            config=classify_config()
+        )
+        add_usage(totals, response)
+        bill_type = BillTypeGuess.model_validate_json(strip_fences(response.text or "")).bill_type
+    except Exception:
+        # Classification is only an optimization; fall back to the full prompt
+        return None
+
+    if cache:
+        cache.put(small, CLASSIFIER_MODEL, CLASSIFY_PROMPT, {"bill_type": bill_type})
+    return bill_type
+
+
+def validate_or_retry(client, image_bytes, mime_type, response_text, sections, totals,
+                      resilience=DEFAULT_RESILIENCE, model=MODEL_NAME):
+    """Validate a response against the schema, asking the model once more if it doesn't fit."""
+    try:
+        return parse_receipt(strip_fences(response_text))
+    except ReceiptValidationError as e:
+        from google.genai import types
+
+        # One targeted retry: show the model its own answer and what was wrong with it
+        contents = [
+            types.Content(
+                role="user",
+                parts=build_contents(image_bytes, mime_type, build_system_prompt(sections))
+            ),
+            types.Content(role="model", parts=[types.Part.from_text(text=response_text)]),
+            types.Content(role="user", parts=[types.Part.from_text(
+                text=f"That response failed validation:\n{e}\nReturn the corrected JSON object only."
+            )])
+        ]
+        response = resilience.call(
+            client.models.generate_content,
+            model=model,
+            contents=contents,
+            config=generation_config(sections)
+        )
+        add_usage(totals, response)
+        return parse_receipt(strip_fences(response.text or ""))
+
+
+def stream_response(client, contents, sections, on_update, model=MODEL_NAME):
+    """Stream one extraction, calling `on_update` as fields complete; returns (text, last chunk)."""
+    stream = client.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generation_config(sections)
+    )
+    
+    # Re-render only when a chunk completes another field
+    parsed = StreamingJSON()
+    last_chunk = None
+    for chunk in stream:
+        last_chunk = chunk
+        if parsed.feed(chunk.text) and parsed.value:
+            on_update(parsed.value)
+    return parsed.text, last_chunk
+
+
+def avg_logprobs(response):
+    """Mean token log-probability of a response, when Gemini reports it."""
+    candidates = getattr(response, "candidates", None) or []
+    return getattr(candidates[0], "avg_logprobs", None) if candidates else None
+
+
+def analyze_receipt(image_bytes, mime_type, client, on_update=None, two_stage=False,
+                    usage=None, cache=None, resilience=DEFAULT_RESILIENCE, tiered=False):
+    """Send image to Gemini API and get structured receipt data.
+
+    Passing `on_update` streams the response and calls `on_update(partial_data)` as
+    sections arrive. With `two_stage`, a cheap classification pass picks the bill type
+    first so the extraction prompt only carries the sections that bill type needs.
+    With `tiered`, the receipt goes to the cheapest of `MODEL_TIERS` first and
+    only moves up a tier when its numbers don't reconcile or the model was unsure.
+    Throttling and transient failures are retried through `resilience`. Each
+    stage is timed, and tokens are counted, in `metrics.METRICS`.
+    """
+    if not client:
+        return None, "An API key is required to analyze receipts."
+
+    totals = {}
+    with METRICS.span("analyze", payload_bytes=len(image_bytes), two_stage=two_stage) as span:
+        try:
+            receipt_data = _analyze(image_bytes, mime_type, client, on_update, two_stage, usage, cache,
+                                    resilience, totals, tiered)
+            error = None
+        except ReceiptValidationError as e:
+            receipt_data, error = None, f"Response did not match the receipt schema: {str(e)}"
+        except Exception as e:
+            receipt_data, error = None, f"Error analyzing receipt: {str(e)}"
+        span.update(totals)
+        if error:
+            span["error"] = error
+    METRICS.inc("tokens", totals.get("prompt_tokens", 0), kind="prompt")
+    METRICS.inc("tokens", totals.get("response_tokens", 0), kind="candidates")
+    METRICS.inc("receipts", status="error" if error else "ok")
+    return receipt_data, error
+
+
+def _analyze(image_bytes, mime_type, client, on_update, two_stage, usage, cache, resilience, totals, tiered):
+    """The body of `analyze_receipt`, one span per stage; raises on failure."""
+    started = time.perf_counter()
+    sections = None
+    if two_stage:
+        with METRICS.span("classify"):
+            bill_type = classify_bill_type(client, image_bytes, mime_type, totals, cache, resilience)
+        sections = sections_for(bill_type)
+    with METRICS.span("request_build"):
+        contents = build_contents(image_bytes, mime_type, build_system_prompt(sections))
+
+    models = MODEL_TIERS if tiered else (MODEL_NAME,)
+    attempts = totals.setdefault("attempts", [])
+    for model in models:
+        last = model == models[-1]
+        # Network and model time together; with streaming this includes rendering the partial results
+        with METRICS.span("model", streaming=bool(on_update), model=model):
+            if on_update:
+                # A failed stream is restarted from scratch, so partial results are re-rendered
+                response_text, response = resilience.call(
+                    stream_response, client, contents, sections, on_update, model
+                )
+            else:
+                # Generate content using the new API
+                response = resilience.call(
+                    client.models.generate_content,
+                    model=model,
+                    contents=contents,
+                    config=generation_config(sections)
+                )
+                response_text = response.text or ""
+            add_usage(totals, response)  # when streaming, usage is reported on the final chunk
+
+        # Validate and coerce against the receipt schema
+        with METRICS.span("parse"):
+            try:
+                receipt_data = validate_or_retry(
+                    client, image_bytes, mime_type, response_text, sections, totals, resilience, model
+                )
+            except ReceiptValidationError:
+                if last:
+                    raise
+                attempts.append({"model": model, "checks": {}, "accepted": False})
+                METRICS.inc("model_attempts", model=model, outcome="escalated")
+                continue
+
+        # Reconcile the arithmetic locally; a lower tier that doesn't add up escalates
+        report = reconcile(receipt_data)
+        accepted = last or not escalation_reasons(receipt_data, report, avg_logprobs(response))
+        attempts.append({"model": model, "checks": report["checks"], "accepted": accepted})
+        METRICS.inc("model_attempts", model=model, outcome="accepted" if accepted else "escalated")
+        for check, passed in report["checks"].items():
+            if passed is not None:
+                METRICS.inc("reconciliation", check=check, result="pass" if passed else "fail")
+        if accepted:
+            break
+
+    if usage is not None:
+        mode = "two-stage" if two_stage else "single prompt"
+        usage.record(f"{mode}, tiered" if tiered else mode, totals, time.perf_counter() - started)
+    return receipt_data
+
+
+def cache_identity(two_stage=False, tiered=False):
+    """The `(model, prompt)` pair results of this extraction mode are cached under.
+
+    Tiered results may come from any of `MODEL_TIERS` and two-stage results from
+    a trimmed prompt, so neither is ever served for a standard extraction.
+    """
+    model = "tiered:" + ">".join(MODEL_TIERS) if tiered else MODEL_NAME
+    if not two_stage:
+        return model, SYSTEM_PROMPT
+    # Every prompt the classifier can lead to, so changing any of them misses the cache
+    prompts = dict.fromkeys(build_system_prompt(sections_for(bill_type)) for bill_type in BILL_TYPES)
+    return model, "two-stage:" + CLASSIFY_PROMPT + "".join(prompts)
+
+
+def analyze_with_cache(image_bytes, mime_type, client, cache=None, on_update=None,
+                       two_stage=False, usage=None, resilience=DEFAULT_RESILIENCE, tiered=False):
+    """Return `(data, error, from_cache)`, reusing a cached result of the same extraction mode when there is one."""
+    model, prompt = cache_identity(two_stage, tiered)
+    cached = cache.get(image_bytes, model, prompt) if cache else None
+    if cache:
+        METRICS.inc("cache_requests", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached, None, True
+
+    result, error = analyze_receipt(
+        image_bytes, mime_type, client, on_update, two_stage, usage, cache, resilience, tiered
+    )
+    if cache and result and not error:
+        cache.put(image_bytes, model, prompt, result)
+    return result, error, False
+
+
+def analyze_pdf(pdf_bytes, client, cache=None, on_page=None, usage=None, resilience=DEFAULT_RESILIENCE,
+                max_workers=None, pages=None):
+    """Extract a PDF page by page, all pages at once, and merge them; returns `(data, error, from_cache)`.
+
+    `pages` are the already split pages, if the caller has them. See `pdf.extract_pages` for `on_page`.
+    """
+    try:
+        pages = pages or split_pages(pdf_bytes)
+    except ValueError as e:
+        return None, str(e), False
+
+    def analyze_page(page):
+        return analyze_with_cache(page, PDF_MIME, client, cache, usage=usage, resilience=resilience)
+
+    return extract_pages(pages, analyze_page, max_workers, on_page)
+
+
+def analyze_tiled(image_bytes, mime_type, client, cache=None, on_tile=None, usage=None,
+                  resilience=DEFAULT_RESILIENCE, settings=PreprocessSettings(), max_workers=None):
+    """Extract a tall receipt photo as overlapping tiles, all at once, and merge them; returns `(data, error, from_cache)`.
+
+    Tiles are cut from the full-resolution image and each is preprocessed on its
+    own, so no line is shrunk below legibility. `on_tile` is called like
+    `on_page` in `pdf.extract_pages`.
+    """
+    try:
+        tiles = split_tiles(image_bytes)
+    except (OSError, ValueError) as e:
+        return None, f"Could not read the image: {e}", False
+
+    def analyze_tile(tile):
+        payload, payload_mime, _ = preprocess_image(tile, "image/jpeg", settings)
+        return analyze_with_cache(payload, payload_mime, client, cache, usage=usage, resilience=resilience)
+
+    return extract_pages(tiles, analyze_tile, max_workers, on_tile, merge=merge_tiles, label="Tile")
+
+
+def analyze_document(file_bytes, mime_type, client, cache=None, on_update=None, stream=False, two_stage=False,
+                     usage=None, resilience=DEFAULT_RESILIENCE, tiered=False, settings=PreprocessSettings(),
+                     split_tall=False):
+    """Extract one uploaded file the way its type calls for; returns `(data, error, from_cache, stats, mode)`.
+
+    PDFs are extracted page by page ("pdf"), very tall photos as tiles when
+    `split_tall` is set ("tiles"), anything else in one call, streamed if
+    `stream` is set ("stream" or "single"). `on_update(partial, note)` gets the
+    pages or tiles merged so far with a progress note, or streamed partials
+    with no note. `stats` are the preprocessing stats of the payload sent.
+    """
+    if split_tall and mime_type.startswith("image/") and is_tall(file_bytes):
+        # Tiles are cut from the full-resolution photo and shrunk one by one
+        stats = {"original_bytes": len(file_bytes), "processed_bytes": len(file_bytes), "seconds": 0.0}
+        on_tile = on_update and (lambda done, total, merged: on_update(merged, f"✂️ {done}/{total} tiles extracted..."))
+        result = analyze_tiled(file_bytes, mime_type, client, cache, on_tile, usage, resilience, settings)
+        return result + (stats, "tiles")
+
+    payload, payload_mime, stats = preprocess_image(file_bytes, mime_type, settings)
+    METRICS.observe(
+        "preprocess", stats["seconds"], original_bytes=stats["original_bytes"], sent_bytes=stats["processed_bytes"]
+    )
+    METRICS.inc("payload_bytes", stats["original_bytes"], kind="original")
+    METRICS.inc("payload_bytes", stats["processed_bytes"], kind="sent")
+    if payload_mime == PDF_MIME:
+        # Pages are extracted in parallel and shown as they complete
+        on_page = on_update and (lambda done, total, merged: on_update(merged, f"📄 {done}/{total} pages extracted..."))
+        result = analyze_pdf(payload, client, cache, on_page, usage, resilience)
+        return result + (stats, "pdf")
+
+    result = analyze_with_cache(
+        payload, payload_mime, client, cache, on_update if stream else None, two_stage, usage, resilience, tiered
+    )
+    return result + (stats, "stream" if stream else "single")
@@ -0,0 +1,237 @@
+"""Process-wide background queue for receipt analysis, persisted in SQLite.
+
+The Streamlit script only submits a job and polls it, so a rerun, a page
+switch or a closed tab no longer throws away an analysis in progress, and a
+long Gemini call never blocks a session's script thread. A pool of worker
+threads runs the jobs. The table keeps each job's payload until it finishes,
+so it survives restarts: jobs that were running when the process stopped
+are queued again.
+
+Submitting an image that is already queued or running with the same options
+and API key returns the existing job's id instead of analyzing it a second
+time. Jobs of different keys never coalesce: the job's calls are billed to
+the key of the client it runs with.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .cache import hash_bytes
+from .metrics import METRICS
+from .store import DEFAULT_DATA_DIR
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+DEFAULT_WORKERS = 8
+# Finished jobs are kept this long for sessions still polling them
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_name TEXT,
+    mime_type TEXT NOT NULL,
+    options TEXT NOT NULL,
+    payload BLOB,
+    data TEXT,
+    error TEXT,
+    from_cache INTEGER NOT NULL DEFAULT 0,
+    info TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created);
+"""
+
+
+def job_key(payload, mime_type, options, api_key_id=None):
+    """Identity of a job: the same bytes analyzed the same way with the same API key coalesce onto one job."""
+    return hash_bytes(
+        f"{hash_bytes(payload)}:{mime_type}:{json.dumps(options, sort_keys=True)}:{api_key_id}".encode("utf-8")
+    )
+
+
+class JobQueue:
+    """SQLite-backed job table with a pool of worker threads running `runner`.
+
+    `runner(job, on_update)` gets the job as a dict (payload, mime_type,
+    file_name, options, client) and returns `(data, error, from_cache, info)`,
+    `info` being any JSON-serializable details for the UI. It may call
+    `on_update(partial, note=None)` with partial results, which `get()`
+    reports while the job runs.
+
+    Clients carry the user's API key, so they are only held in memory. A job
+    recovered after a restart waits until a submission of the same image
+    brings a client, unless the queue has a `default_client`. `release(client)`
+    is called once the queue no longer needs a submitted client: when its job
+    finishes, or straight away when the job already had one.
+    """
+
+    def __init__(self, runner, path=None, workers=DEFAULT_WORKERS, max_age=DEFAULT_MAX_AGE,
+                 default_client=None, release=None):
+        self.runner = runner
+        self.path = path or os.path.join(DEFAULT_DATA_DIR, "jobs.sqlite3")
+        self.default_client = default_client
+        self.release = release
+        self._clients = {}
+        self._partials = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            self._conn.execute("DELETE FROM jobs WHERE created < ?", (time.time() - max_age,))
+            # Interrupted by a restart: start over
+            self._conn.execute("UPDATE jobs SET status = ?, started = NULL WHERE status = ?", (QUEUED, RUNNING))
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, payload, mime_type, client=None, file_name=None, api_key_id=None, **options):
+        """Queue `payload` and return its job id, or the id of the same job already queued or running.
+
+        `api_key_id` (see `clients.key_id`) identifies the key `client` uses,
+        so a job only ever takes a client of its own key.
+        """
+        key = job_key(payload, mime_type, options, api_key_id)
+        with self._wake:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY created LIMIT 1",
+                (key, QUEUED, RUNNING),
+            ).fetchone()
+            if row:
+                job_id = row["id"]
+            else:
+                job_id = uuid.uuid4().hex
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, key, status, file_name, mime_type, options, payload, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, key, QUEUED, file_name, mime_type, json.dumps(options), payload, time.time()),
+                    )
+            if client is not None and self._clients.setdefault(job_id, client) is not client:
+                self._release(client)
+            self._wake.notify()
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict (status, data, error, partial results while running...), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, file_name, mime_type, data, error, from_cache, info, created, started, finished "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["partial"], job["note"] = self._partials.get(job_id, (None, None))
+            if job["status"] == QUEUED:
+                job["ahead"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, job["created"])
+                ).fetchone()[0]
+        job["data"] = json.loads(job["data"]) if job["data"] else None
+        job["info"] = json.loads(job["info"]) if job["info"] else {}
+        job["from_cache"] = bool(job["from_cache"])
+        return job
+
+    def stats(self):
+        """Number of jobs per status."""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def _claim(self):
+        """Mark the oldest runnable queued job as running and return it, or None. Needs the lock."""
+        for row in self._conn.execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)
+        ).fetchall():
+            client = self._clients.get(row["id"], self.default_client)
+            if client is None:
+                continue
+            now = time.time()
+            with self._conn:
+                self._conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, now, row["id"]))
+            job = dict(self._conn.execute(
+                "SELECT id, file_name, mime_type, options, payload, created FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone())
+            job["options"] = json.loads(job["options"])
+            job["client"] = client
+            job["started"] = now
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._wake:
+                while not self._closed:
+                    job = self._claim()
+                    if job is not None:
+                        break
+                    self._wake.wait()
+                else:
+                    return
+            METRICS.observe("queue_wait", job["started"] - job["created"])
+
+            def on_update(partial, note=None, job_id=job["id"]):
+                self._partials[job_id] = (partial, note)
+
+            try:
+                data, error, from_cache, info = self.runner(job, on_update)
+            except Exception as e:
+                data, error, from_cache, info = None, f"Error analyzing receipt: {e}", False, None
+            self._finish(job["id"], data, error, from_cache, info)
+
+    def _finish(self, job_id, data, error, from_cache, info):
+        status = DONE if data and not error else FAILED
+        if status == FAILED and not error:
+            error = "Could not extract data from the receipt. Please try a clearer image."
+        with self._lock:
+            with self._conn:
+                # The payload is only needed to rerun the job
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, data = ?, error = ?, from_cache = ?, info = ?, finished = ?, "
+                    "payload = NULL WHERE id = ?",
+                    (
+                        status,
+                        json.dumps(data, ensure_ascii=False) if status == DONE else None,
+                        error,
+                        int(bool(from_cache)),
+                        json.dumps(info or {}, default=str),
+                        time.time(),
+                        job_id,
+                    ),
+                )
+            client = self._clients.pop(job_id, None)
+            self._partials.pop(job_id, None)
+        if client is not None:
+            self._release(client)
+
+    def _release(self, client):
+        if self.release is not None:
+            self.release(client)
+
+    def close(self):
+        """Stop the workers once their current jobs finish; queued jobs stay queued for the next start."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._conn.close()
@@ -0,0 +1,327 @@
+"""Tolerant parser for JSON that is still being streamed.
+
+`parse_partial` turns any prefix of a JSON document into the largest value
+that can be recovered from it. Objects and arrays are returned with the
+members received so far, but scalars are only included once they are
+complete, so a price is never shown as `12` while `12.50` is still arriving.
+"""
+import json
+import re
+
+_INCOMPLETE = object()
+_WHITESPACE = " \t\r\n"
+_LITERALS = {"true": True, "false": False, "null": None}
+_NOT_WHITESPACE = re.compile(r"[^ \t\r\n]")
+_SCALAR_END = re.compile(r"[,\]} \t\r\n]")
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def skip(self):
+        while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+            self.pos += 1
+
+    def at_end(self):
+        self.skip()
+        return self.pos >= len(self.text)
+
+    def value(self):
+        """Parse one value; returns (value, complete)."""
+        if self.at_end():
+            return _INCOMPLETE, False
+        char = self.text[self.pos]
+        if char == "{":
+            return self.object()
+        if char == "[":
+            return self.array()
+        if char == '"':
+            return self.string()
+        return self.scalar()
+
+    def string(self):
+        end = self.pos + 1
+        while end < len(self.text):
+            char = self.text[end]
+            if char == "\\":
+                end += 2
+                continue
+            if char == '"':
+                raw = self.text[self.pos:end + 1]
+                self.pos = end + 1
+                return json.loads(raw), True
+            end += 1
+        self.pos = len(self.text)
+        return _INCOMPLETE, False
+
+    def scalar(self):
+        end = self.pos
+        while end < len(self.text) and self.text[end] not in ",]}" + _WHITESPACE:
+            end += 1
+        token = self.text[self.pos:end]
+        self.pos = end
+        if end >= len(self.text):
+            # A number or literal at the very end may still be growing
+            return _INCOMPLETE, False
+        if token in _LITERALS:
+            return _LITERALS[token], True
+        try:
+            return json.loads(token), True
+        except ValueError:
+            raise ValueError(f"Invalid JSON token {token!r}") from None
+
+    def object(self):
+        result = {}
+        self.pos += 1
+        while True:
+            if self.at_end():
+                return result, False
+            if self.text[self.pos] == "}":
+                self.pos += 1
+                return result, True
+            if self.text[self.pos] == ",":
+                self.pos += 1
+                continue
+            if self.text[self.pos] != '"':
+                raise ValueError(f"Expected a key at position {self.pos}")
+            key, complete = self.string()
+            if not complete or self.at_end():
+                return result, False
+            if self.text[self.pos] != ":":
+                raise ValueError(f"Expected ':' at position {self.pos}")
+            self.pos += 1
+            value, complete = self.value()
+            if value is not _INCOMPLETE:
+                result[key] = value
+            if not complete:
+                return result, False
+
+    def array(self):
+        result = []
+        self.pos += 1
+        while True:
+            if self.at_end():
+                return result, False
+            if self.text[self.pos] == "]":
+                self.pos += 1
+                return result, True
+            if self.text[self.pos] == ",":
+                self.pos += 1
+                continue
+            value, complete = self.value()
+            if value is not _INCOMPLETE:
+                result.append(value)
+            if not complete:
+                return result, False
+
+
+def strip_fences(text):
+    """Drop a leading markdown code fence (and a trailing one if present)."""
+    text = text.lstrip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    # Trailing whitespace stays unless a fence follows it: it ends a number or literal
+    stripped = text.rstrip()
+    if stripped.endswith("```"):
+        text = stripped[:-3]
+    return text
+
+
+def parse_partial(text):
+    """Return the value recoverable from a JSON prefix, or None if nothing is yet."""
+    text = strip_fences(text)
+    start = text.find("{")
+    if start < 0:
+        return None
+    value, _ = _Parser(text[start:]).value()
+    return None if value is _INCOMPLETE else value
+
+
+class StreamingJSON:
+    """Accumulates streamed text chunks and exposes the partial document.
+
+    Each chunk is parsed once, picking up where the previous one stopped: the
+    parser keeps the containers still open and any string or number cut off
+    at the end of a chunk. The work for a whole stream is therefore linear in
+    its length, where re-parsing the text so far after every chunk is
+    quadratic. Recovers the same values as `parse_partial` at every point.
+
+    `value` is a snapshot that later chunks never modify: closed containers
+    are shared with the parser (they can't change anymore), and only the
+    containers still open are copied, one level each.
+    """
+
+    def __init__(self):
+        self.value = None
+        self._chunks = []
+        self._text = ""
+        self._root = None
+        # Open containers, outermost first, as [container, current key, expected token]
+        self._stack = []
+        # A string or number cut off at the end of a chunk
+        self._token = None
+        self._kind = None
+        self._is_key = False
+        self._escaped = False
+        self._changed = False
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk):
+        """Append a chunk; returns True when the recoverable value changed."""
+        if not chunk:
+            return False
+        self._chunks.append(chunk)
+        self._changed = False
+        self._consume(chunk)
+        if not self._changed:
+            return False
+        self.value = self._snapshot()
+        return True
+
+    def _consume(self, text):
+        pos, end = 0, len(text)
+        while pos < end:
+            if self._kind == "string":
+                pos = self._string(text, pos)
+                continue
+            if self._kind == "scalar":
+                match = _SCALAR_END.search(text, pos)
+                if match is None:
+                    self._token.append(text[pos:])
+                    return
+                self._token.append(text[pos:match.start()])
+                pos = match.start()
+                self._scalar()
+                continue
+            if not self._stack:
+                if self._root is not None:
+                    # The document is complete; anything after it (a closing fence) is ignored
+                    return
+                start = text.find("{", pos)
+                if start < 0:
+                    return
+                self._root = {}
+                self._stack.append([self._root, None, "key"])
+                self._changed = True
+                pos = start + 1
+                continue
+
+            match = _NOT_WHITESPACE.search(text, pos)
+            if match is None:
+                return
+            pos = match.start()
+            char = text[pos]
+            frame = self._stack[-1]
+            container, _, expected = frame
+            if expected == "colon":
+                if char != ":":
+                    raise ValueError(f"Expected ':' but got {char!r}")
+                frame[2] = "value"
+                pos += 1
+                continue
+            if expected == "key":
+                pos += 1
+                if char == "}":
+                    self._stack.pop()
+                elif char == '"':
+                    self._start("string", is_key=True)
+                elif char != ",":
+                    raise ValueError(f"Expected a key but got {char!r}")
+                continue
+            if isinstance(container, list) and char in "],":
+                pos += 1
+                if char == "]":
+                    self._stack.pop()
+                continue
+            if char in "{[":
+                child = {} if char == "{" else []
+                self._attach(child)
+                self._stack.append([child, None, "key" if char == "{" else "value"])
+                pos += 1
+            elif char == '"':
+                self._start("string")
+                pos += 1
+            else:
+                # The first character is part of the number or literal
+                self._start("scalar")
+
+    def _start(self, kind, is_key=False):
+        self._kind = kind
+        self._token = []
+        self._is_key = is_key
+
+    def _string(self, text, pos):
+        """Continue a string at `pos`; returns the position after it, or the end of `text`."""
+        if self._escaped:
+            self._token.append(text[pos])
+            self._escaped = False
+            pos += 1
+        while True:
+            match = _STRING_SPECIAL.search(text, pos)
+            if match is None:
+                self._token.append(text[pos:])
+                return len(text)
+            end = match.start()
+            if text[end] == "\\":
+                # Keep the escape and the character after it, which may be in the next chunk
+                if end + 1 < len(text):
+                    self._token.append(text[pos:end + 2])
+                    pos = end + 2
+                    continue
+                self._token.append(text[pos:end + 1])
+                self._escaped = True
+                return len(text)
+            self._token.append(text[pos:end])
+            value = json.loads('"' + "".join(self._token) + '"')
+            self._kind = self._token = None
+            if self._is_key:
+                self._stack[-1][1] = value
+                self._stack[-1][2] = "colon"
+            else:
+                self._attach(value)
+            return end + 1
+
+    def _scalar(self):
+        token = "".join(self._token)
+        self._kind = self._token = None
+        if token in _LITERALS:
+            self._attach(_LITERALS[token])
+            return
+        try:
+            self._attach(json.loads(token))
+        except ValueError:
+            raise ValueError(f"Invalid JSON token {token!r}") from None
+
+    def _attach(self, value):
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[0][frame[1]] = value
+            frame[2] = "key"
+        else:
+            frame[0].append(value)
+        self._changed = True
+
+    def _snapshot(self):
+        """The document so far, copying only the open containers."""
+        value = None
+        for container, key, _ in reversed(self._stack):
+            copy = container.copy()
+            if value is not None:
+                # The open child sits under the parent's current key, or last in a list
+                if isinstance(copy, dict):
+                    copy[key] = value
+                else:
+                    copy[-1] = value
+            value = copy
+        return value if self._stack else self._root
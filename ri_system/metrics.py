@@ -0,0 +1,179 @@
+"""Lightweight span timings and counters, exported as Prometheus text or a JSONL trace.
+
+`METRICS` is the process-wide registry. Code wraps a stage in
+`with METRICS.span("model") as span:` and may add attributes to `span`
+(bytes, tokens, mode); counters cover tokens, payload bytes and cache hits.
+
+- `METRICS.summary()` gives p50/p95 per span over a recent window, for the sidebar
+- `METRICS.prometheus()` renders everything in the Prometheus text format;
+  `serve()` exposes it on `/metrics` from a background thread
+- `METRICS.trace_to(path)` appends every span as a JSON line to a rotating file
+
+`setup_from_env()` turns the exports on from `RI_METRICS_PORT` (plus
+`RI_METRICS_HOST`, default 127.0.0.1) and `RI_TRACE_FILE`.
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# Recent samples per span used for quantiles
+WINDOW = 1024
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 3
+
+# Counter name -> help text, in export order
+COUNTERS = {
+    "tokens": "Tokens reported by Gemini usage_metadata, by kind (prompt, candidates)",
+    "payload_bytes": "Upload bytes before and after preprocessing, by kind (original, sent)",
+    "cache_requests": "Result cache lookups, by result (hit, miss)",
+    "receipts": "Analyzed receipts, by status (ok, error)",
+    "model_attempts": "Extraction attempts, by model and outcome (accepted, escalated)",
+    "reconciliation": "Arithmetic checks on extracted receipts, by check (items, total, taxes) and result",
+}
+
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    """Thread-safe span timings (count, sum, recent window) and labelled counters."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = defaultdict(float)
+        self._trace = None
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the block; the yielded dict's attributes go into the trace event."""
+        started = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **attrs)
+
+    def observe(self, name, seconds, **attrs):
+        """Record a span duration measured elsewhere."""
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {"count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)}
+            span["count"] += 1
+            span["sum"] += seconds
+            span["recent"].append(seconds)
+        if self._trace:
+            self._trace.info(json.dumps(
+                {"ts": round(time.time(), 3), "span": name, "ms": round(seconds * 1000, 2), **attrs},
+                default=str
+            ))
+
+    def inc(self, name, value=1, **labels):
+        """Add `value` to a labelled counter."""
+        if value:
+            with self._lock:
+                self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def summary(self):
+        """Per-span count and p50/p95 in milliseconds over the recent window, as a list of dicts."""
+        with self._lock:
+            spans = {name: (span["count"], sorted(span["recent"])) for name, span in self._spans.items()}
+        return [
+            {
+                "Stage": name,
+                "Count": count,
+                "p50 (ms)": round(statistics.median(recent) * 1000, 1),
+                "p95 (ms)": round(_quantile(recent, 0.95) * 1000, 1),
+            }
+            for name, (count, recent) in spans.items()
+        ]
+
+    def prometheus(self):
+        """All spans and counters in the Prometheus text exposition format."""
+        with self._lock:
+            spans = {name: (span["count"], span["sum"], sorted(span["recent"])) for name, span in self._spans.items()}
+            counters = dict(self._counters)
+        lines = [
+            "# HELP ri_span_seconds Duration of pipeline stages (quantiles over recent spans)",
+            "# TYPE ri_span_seconds summary",
+        ]
+        for name, (count, total, recent) in sorted(spans.items()):
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'ri_span_seconds{{span="{name}",quantile="{q}"}} {_quantile(recent, q):.6f}')
+            lines.append(f'ri_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append(f'ri_span_seconds_count{{span="{name}"}} {count}')
+        for counter, help_text in COUNTERS.items():
+            lines.append(f"# HELP ri_{counter}_total {help_text}")
+            lines.append(f"# TYPE ri_{counter}_total counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == counter:
+                    lines.append(f"ri_{counter}_total{{{_labels(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def trace_to(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        """Append every span to `path` as JSON lines, rotating at `max_bytes`."""
+        if self._trace:
+            return
+        logger = logging.getLogger(f"ri_system.trace.{id(self)}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        self._trace = logger
+
+
+def serve(metrics, port, host="127.0.0.1"):
+    """Serve `metrics.prometheus()` on http://host:port/metrics from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    return server
+
+
+METRICS = Metrics()
+
+
+def setup_from_env(metrics=METRICS):
+    """Start the exports configured in the environment; returns the endpoint URL, if any."""
+    if os.environ.get("RI_TRACE_FILE"):
+        metrics.trace_to(os.environ["RI_TRACE_FILE"])
+    if os.environ.get("RI_METRICS_PORT"):
+        host = os.environ.get("RI_METRICS_HOST", "127.0.0.1")
+        server = serve(metrics, int(os.environ["RI_METRICS_PORT"]), host)
+        return f"http://{host}:{server.server_address[1]}/metrics"
+    return None
@@ -0,0 +1,139 @@
+"""Multi-page PDF bills: split into pages, extract pages concurrently, merge.
+
+Gemini reads PDFs natively, so pages are sent as single-page PDFs rather
+than rasterized. Splitting needs `pypdf` (in requirements.txt); without it
+the whole document is sent as one part, which works but takes as long as
+the model needs to read every page in turn.
+"""
+import importlib.util
+import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+PDF_MIME = "application/pdf"
+# Pages extracted per document; longer statements are refused rather than billed page by page
+MAX_PAGES = 50
+
+CAN_SPLIT = importlib.util.find_spec("pypdf") is not None
+
+
+def _reader(pdf_bytes, max_pages):
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    if len(reader.pages) > max_pages:
+        raise ValueError(f"The PDF has {len(reader.pages)} pages; at most {max_pages} are supported.")
+    return reader
+
+
+def page_count(pdf_bytes, max_pages=MAX_PAGES):
+    """Number of pages, read without splitting the document (None if pypdf isn't installed).
+
+    Raises ValueError like `split_pages`.
+    """
+    if not CAN_SPLIT:
+        return None
+    from pypdf.errors import PdfReadError
+
+    try:
+        return len(_reader(pdf_bytes, max_pages).pages)
+    except PdfReadError as e:
+        raise ValueError(f"Could not read the PDF: {e}") from e
+
+
+def split_pages(pdf_bytes, max_pages=MAX_PAGES):
+    """The document as a list of single-page PDFs (the whole document if pypdf isn't installed).
+
+    Raises ValueError for documents over `max_pages` pages or that can't be read.
+    """
+    if not CAN_SPLIT:
+        return [pdf_bytes]
+    from pypdf import PdfWriter
+    from pypdf.errors import PdfReadError
+
+    try:
+        reader = _reader(pdf_bytes, max_pages)
+        pages = []
+        for page in reader.pages:
+            writer = PdfWriter()
+            writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            pages.append(buffer.getvalue())
+    except PdfReadError as e:
+        raise ValueError(f"Could not read the PDF: {e}") from e
+    return pages
+
+
+def merge_pages(pages):
+    """Combine per-page receipt dicts (in page order, None for missing pages) into one receipt.
+
+    Items are concatenated. Header sections (merchant, transaction, payment, ...)
+    take each field from the first page that has it. Pricing comes from the last
+    page carrying a total, with fields it lacks filled in from the other pages.
+    """
+    pages = [page for page in pages if page]
+    if len(pages) <= 1:
+        return dict(pages[0]) if pages else {}
+
+    merged = {}
+    for page in pages:
+        for key, value in page.items():
+            if key in ("items", "pricing"):
+                continue
+            if isinstance(value, dict):
+                section = merged.setdefault(key, {})
+                for field, field_value in value.items():
+                    section.setdefault(field, field_value)
+            else:
+                merged.setdefault(key, value)
+
+    items = [item for page in pages for item in page.get("items") or []]
+    if items:
+        merged["items"] = items
+
+    pricings = [page.get("pricing") or {} for page in pages]
+    # Pages may each carry a subtotal; the page with the total is the one that counts
+    totals = [pricing for pricing in pricings if pricing.get("total_amount") is not None]
+    pricing = {}
+    for source in totals[-1:] + pricings[::-1]:
+        for field, value in source.items():
+            pricing.setdefault(field, value)
+    if pricing:
+        merged["pricing"] = pricing
+    return merged
+
+
+def extract_pages(pages, analyze_page, max_workers=None, on_page=None, merge=merge_pages, label="Page"):
+    """Run `analyze_page(page_bytes) -> (data, error, from_cache)` on all pages concurrently.
+
+    `on_page(done, total, merged_so_far)` is called from the calling thread as
+    each page finishes, so a UI can render pages progressively. Returns
+    `(data, error, from_cache)` for the whole document; any failed page fails
+    the document, since a bill missing a page would be silently incomplete.
+    `merge` combines the per-page results (in page order); `label` names a
+    page in error messages.
+    """
+    results = [None] * len(pages)
+    errors = {}
+    cached = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers or len(pages), len(pages)))) as executor:
+        futures = {executor.submit(analyze_page, page): i for i, page in enumerate(pages)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            try:
+                data, error, from_cache = future.result()
+            except Exception as e:
+                data, error, from_cache = None, str(e), False
+            if error or not data:
+                errors[index] = error or "no data extracted"
+            else:
+                results[index] = data
+                cached += from_cache
+            if on_page:
+                on_page(done, len(pages), merge(results))
+
+    if errors:
+        first = min(errors)
+        prefix = f"{label} {first + 1} of {len(pages)}: " if len(pages) > 1 else ""
+        return None, prefix + errors[first], False
+    return merge(results), None, cached == len(pages)
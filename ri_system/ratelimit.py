@@ -0,0 +1,245 @@
+"""Process-wide rate limits per API key, shared fairly across sessions.
+
+Every session using one API key draws on the same Gemini quota: requests per
+minute (RPM) and prompt tokens per minute (TPM). `RateLimiter` keeps one token
+bucket for each and makes a call wait until both have room, rather than
+letting it fail with a 429 and retry blind.
+
+Waiting calls queue per owner (a browser session, the batch CLI) and owners
+take turns: a batch of fifty receipts in one session gets one request out per
+round, like a single upload in another session, instead of fifty requests
+ahead of it. `expected_wait()` estimates how long a session's next call will
+wait, for the UI to show.
+
+`RateLimits` holds one limiter per API key hash, and `RateLimitedClient` wraps
+a client (or replay backend) so its calls go through one. The limits default
+to `RI_RPM` and `RI_TPM`; 0 turns a limit off.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .backends import estimate_prompt_tokens
+from .metrics import METRICS
+from .resilience import slot_released
+
+# Gemini's default paid-tier quota for the extraction model; set these to the key's actual limits
+DEFAULT_RPM = int(os.environ.get("RI_RPM", 1000))
+DEFAULT_TPM = int(os.environ.get("RI_TPM", 1_000_000))
+PERIOD = 60.0
+# Share of a limit that may go out at once; the rest is spread over the period
+BURST = 0.1
+
+
+class TokenBucket:
+    """At most `limit` units in any `period` seconds; not thread-safe on its own.
+
+    The bucket holds a `burst` share of the limit and refills the rest evenly
+    over the period, so a full bucket plus one period's refill is the limit.
+    A bucket holding the whole limit would let twice the limit through in the
+    first period and draw 429s from a quota counted per minute.
+    """
+
+    def __init__(self, limit, period=PERIOD, burst=BURST, clock=time.monotonic):
+        self.capacity = limit * burst
+        self.rate = limit * (1 - burst) / period
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+
+    def level(self):
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._level
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units (at most a full bucket) are available."""
+        return max(0.0, (min(amount, self.capacity) - self.level()) / self.rate)
+
+    def take(self, amount):
+        """Remove `amount` units; the level may go negative, delaying later takers."""
+        self._level = self.level() - amount
+
+    def put(self, amount):
+        self._level = min(self.capacity, self.level() + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits, with waiting calls served round-robin by owner."""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, period=PERIOD, clock=time.monotonic):
+        self.requests = TokenBucket(rpm, period, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, period, clock=clock) if tpm else None
+        self._clock = clock
+        self._cond = threading.Condition()
+        # owner -> tickets (estimated tokens) in arrival order; the first owner is served next
+        self._queues = OrderedDict()
+        self.calls = 0
+        self.delayed = 0
+        self.wait_seconds = 0.0
+
+    def _wait_time(self, tokens):
+        wait = self.requests.wait_time(1) if self.requests else 0.0
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _is_next(self, owner, ticket):
+        queue = self._queues[owner]
+        return next(iter(self._queues)) == owner and queue[0] is ticket
+
+    def acquire(self, tokens=0, owner=None):
+        """Wait for this owner's turn and for room for one request of `tokens`; returns the seconds waited."""
+        ticket = [tokens]
+        started = self._clock()
+        with self._cond:
+            self._queues.setdefault(owner, deque()).append(ticket)
+            try:
+                while True:
+                    if self._is_next(owner, ticket):
+                        wait = self._wait_time(tokens)
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self.requests:
+                    self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(tokens)
+            finally:
+                queue = self._queues[owner]
+                queue.remove(ticket)
+                if queue:
+                    # Served (or gave up): this owner's next call goes to the back of the rotation
+                    self._queues.move_to_end(owner)
+                else:
+                    del self._queues[owner]
+                self._cond.notify_all()
+            waited = self._clock() - started
+            self.calls += 1
+            if waited > 0.001:
+                self.delayed += 1
+                self.wait_seconds += waited
+        return waited
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once a response reports the prompt tokens actually billed."""
+        if not self.tokens or actual is None:
+            return
+        with self._cond:
+            if actual > estimated:
+                self.tokens.take(actual - estimated)
+            else:
+                self.tokens.put(estimated - actual)
+            self._cond.notify_all()
+
+    def queued(self, owner=None):
+        """Number of `owner`'s calls waiting for their turn."""
+        with self._cond:
+            return len(self._queues.get(owner, ()))
+
+    def expected_wait(self, owner=None, tokens=0):
+        """Seconds `owner`'s next call should wait, from the queue ahead of it and the buckets' levels.
+
+        Every other owner in the rotation ahead of it gets one call out first.
+        An owner with nothing queued joins at the back of the rotation.
+        """
+        with self._cond:
+            ahead = []
+            for other, queue in self._queues.items():
+                if other == owner:
+                    tokens = queue[0][0]
+                    break
+                ahead.append(queue[0][0])
+            # Our call goes once the calls ahead have taken theirs and what `acquire` waits for is left
+            wait = 0.0
+            if self.requests:
+                needed = len(ahead) + min(1, self.requests.capacity)
+                wait = max(0.0, (needed - self.requests.level()) / self.requests.rate)
+            if self.tokens:
+                needed = sum(ahead) + min(tokens, self.tokens.capacity)
+                wait = max(wait, (needed - self.tokens.level()) / self.tokens.rate)
+            return wait
+
+    def stats(self):
+        """Requests and tokens that could go out now, calls waiting and wait counters."""
+        with self._cond:
+            return {
+                "requests_available": max(0, int(self.requests.level())) if self.requests else None,
+                "tokens_available": max(0, int(self.tokens.level())) if self.tokens else None,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "calls": self.calls,
+                "delayed": self.delayed,
+                "wait_seconds": self.wait_seconds,
+            }
+
+
+class RateLimits:
+    """One `RateLimiter` per API key hash (see `clients.key_id`), created on first use."""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, period=PERIOD):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.period = period
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_key(self, kid):
+        with self._lock:
+            limiter = self._limiters.get(kid)
+            if limiter is None:
+                limiter = self._limiters[kid] = RateLimiter(self.rpm, self.tpm, self.period)
+            return limiter
+
+
+class _LimitedModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        settle = self._client.wait_turn(contents)
+        response = self._client.client.models.generate_content(model=model, contents=contents, config=config)
+        settle(response)
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        settle = self._client.wait_turn(contents)
+        chunk = None
+        for chunk in self._client.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            yield chunk
+        # Usage comes on the final chunk
+        settle(chunk)
+
+
+class RateLimitedClient:
+    """A client whose model calls wait for their turn under a shared `RateLimiter`.
+
+    `owner` identifies the caller for fair queuing. The wrapped client is
+    usually pooled and shared, so closing it is left to its owner.
+    """
+
+    def __init__(self, client, limiter, owner=None):
+        self.client = client
+        self.limiter = limiter
+        self.owner = owner
+        self.models = _LimitedModels(self)
+
+    def wait_turn(self, contents):
+        """Wait for one request's turn; returns a function settling its token estimate against the response."""
+        estimated = estimate_prompt_tokens(contents)
+        # Queued calls aren't in flight: let others use the concurrency slot meanwhile
+        with slot_released():
+            waited = self.limiter.acquire(estimated, self.owner)
+        METRICS.observe("rate_wait", waited, tokens=estimated)
+
+        def settle(response):
+            usage = getattr(response, "usage_metadata", None)
+            self.limiter.settle(estimated, getattr(usage, "prompt_token_count", None))
+
+        return settle
+
+    def expected_wait(self):
+        return self.limiter.expected_wait(self.owner)
@@ -0,0 +1,266 @@
+"""Streamlit rendering of extracted receipt data.
+
+Rendering cost grows with the number of elements sent to the browser, so
+field lists are sent as one markdown block per column rather than one
+`st.write` per field. The items table is built with a single rename and
+keeps numbers numeric; currency formatting is left to `st.column_config`.
+"""
+import streamlit as st
+
+# Item fields as shown in the items table
+ITEM_COLUMNS = {
+    "item_name": "Item",
+    "item_code": "Code",
+    "category": "Category",
+    "quantity": "Qty",
+    "unit": "Unit",
+    "unit_price": "Unit Price",
+    "discount": "Discount",
+    "tax": "Tax",
+    "total_price": "Total",
+    "notes": "Notes",
+}
+MONEY_COLUMNS = ("Unit Price", "Discount", "Tax", "Total")
+
+MERCHANT_FIELDS = [
+    ("name", "Name"), ("address", "Address"), ("phone", "Phone"), ("email", "Email"),
+    ("website", "Website"), ("tax_id", "Tax ID"), ("branch", "Branch"),
+]
+TRANSACTION_FIELDS = [
+    ("date", "Date"), ("time", "Time"), ("receipt_number", "Receipt #"), ("reference_number", "Reference #"),
+    ("cashier", "Cashier"), ("terminal_id", "Terminal"), ("table_number", "Table #"),
+]
+CUSTOMER_FIELDS = [
+    ("name", "Name"), ("account_number", "Account #"), ("phone", "Phone"),
+    ("email", "Email"), ("address", "Address"), ("loyalty_points", "Loyalty Points"),
+]
+# Payment fields per column
+PAYMENT_FIELDS = [
+    [("method", "Method"), ("card_type", "Card Type"), ("card_last_four", "Card")],
+    [("amount_tendered", "Amount Tendered"), ("change_given", "Change")],
+    [("transaction_id", "Transaction ID"), ("approval_code", "Approval Code")],
+]
+# Bill-type specific sections: (data key, expander title, fields per column)
+DETAIL_SECTIONS = [
+    ("utility_details", "⚡ Utility Bill Details", [
+        [("account_number", "Account #"), ("meter_number", "Meter #"),
+         ("billing_period", "Billing Period"), ("due_date", "Due Date")],
+        [("previous_reading", "Previous Reading"), ("current_reading", "Current Reading"),
+         ("consumption", "Consumption"), ("late_fee", "Late Fee")],
+    ]),
+    ("hotel_details", "🏨 Hotel Stay Details", [
+        [("guest_name", "Guest"), ("room_number", "Room #"), ("room_type", "Room Type"), ("nights", "Nights")],
+        [("check_in", "Check-in"), ("check_out", "Check-out"), ("room_rate", "Nightly Rate")],
+    ]),
+    ("fuel_details", "⛽ Fuel Purchase Details", [
+        [("fuel_type", "Fuel Type"), ("pump_number", "Pump #"), ("liters_gallons", "Volume")],
+        [("price_per_unit", "Price/Unit"), ("odometer", "Odometer"), ("vehicle_plate", "Vehicle Plate")],
+    ]),
+    ("medical_details", "🏥 Medical Bill Details", [
+        [("patient_name", "Patient"), ("provider_name", "Provider"),
+         ("facility", "Facility"), ("diagnosis_codes", "Diagnosis Codes")],
+        [("insurance_info", "Insurance"), ("insurance_paid", "Insurance Paid"),
+         ("patient_responsibility", "Patient Owes")],
+    ]),
+    ("additional_info", "ℹ️ Additional Information", [
+        [("return_policy", "Return Policy"), ("warranty_info", "Warranty"), ("barcode_data", "Barcode"),
+         ("qr_code_content", "QR Code"), ("promotional_messages", "Promotions"), ("notes", "Notes")],
+    ]),
+]
+
+
+def field_lines(source, fields, title=None):
+    """`**Label:** value` lines for the fields that are set (under an optional bold title) as one markdown string."""
+    lines = [f"**{label}:** {source[key]}" for key, label in fields if source.get(key)]
+    if title:
+        lines.insert(0, f"**{title}**")
+    return "  \n".join(lines)
+
+
+def show_fields(source, fields, title=None):
+    """Render set fields as a single markdown element."""
+    text = field_lines(source, fields, title)
+    if text:
+        st.markdown(text)
+
+
+def build_items_table(data):
+    """Line items as a display-ready DataFrame, or None when the receipt has no items.
+
+    Money columns stay numeric (zero shown as empty) so they sort and format as numbers.
+    """
+    items = data.get("items", [])
+    if not items:
+        return None
+    import pandas as pd
+
+    df = pd.DataFrame(items).rename(columns=ITEM_COLUMNS)
+    for col in MONEY_COLUMNS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            df[col] = values.mask(values == 0)
+    # Remove columns that are all null or empty
+    return df.dropna(axis=1, how="all")
+
+
+def items_column_config(columns, currency_symbol):
+    """Currency formatting for the money columns present in the items table (no symbol if it's unknown)."""
+    money_format = (currency_symbol or "").replace("%", "%%") + "%.2f"
+    return {col: st.column_config.NumberColumn(col, format=money_format) for col in MONEY_COLUMNS if col in columns}
+
+
+def display_results(data, items_table=None):
+    """Display the extracted receipt data in a beautiful format.
+
+    `items_table` is the prepared line item table when the caller already built it.
+    """
+
+    # Bill type badge
+    bill_type = data.get("bill_type", "Receipt")
+    st.markdown(f"""
+        <div style="display: inline-block; background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
+        padding: 0.5rem 1.5rem; border-radius: 25px; margin-bottom: 1rem;">
+            <span style="color: white; font-weight: 600; font-size: 1rem;">📄 {bill_type}</span>
+        </div>
+    """, unsafe_allow_html=True)
+
+    # Get nested data safely
+    merchant = data.get("merchant_info", {}) or {}
+    transaction = data.get("transaction_info", {}) or {}
+    customer = data.get("customer_info", {}) or {}
+    pricing = data.get("pricing", {}) or {}
+    payment = data.get("payment", {}) or {}
+    # Streamed partials carry the key with a null value until the symbol arrives
+    curr = pricing.get("currency_symbol") or "$"
+
+    # ===== TOP METRICS =====
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric(
+            label="📅 Date",
+            value=transaction.get("date") or data.get("date", "N/A")
+        )
+
+    with col2:
+        store_name = merchant.get("name") or data.get("store_name", "N/A")
+        display_name = store_name[:18] + "..." if len(str(store_name)) > 18 else store_name
+        st.metric(label="🏪 Merchant", value=display_name)
+
+    with col3:
+        total = pricing.get("total_amount") or data.get("total_amount", 0)
+        currency = pricing.get("currency_symbol") or pricing.get("currency", "")
+        st.metric(
+            label="💰 Total",
+            value=f"{currency} {total:.2f}" if total else "N/A"
+        )
+
+    with col4:
+        method = payment.get("method") or data.get("payment_method", "N/A")
+        st.metric(label="💳 Payment", value=method or "N/A")
+
+    st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
+
+    # ===== MERCHANT & TRANSACTION INFO =====
+    with st.expander("🏢 Merchant & Transaction Details", expanded=True):
+        col1, col2 = st.columns(2)
+        with col1:
+            show_fields(merchant, MERCHANT_FIELDS, "Merchant Information")
+        with col2:
+            show_fields(transaction, TRANSACTION_FIELDS, "Transaction Information")
+
+    # ===== CUSTOMER INFO (if available) =====
+    if customer and any(customer.values()):
+        with st.expander("👤 Customer Information"):
+            cols = st.columns(3)
+            for i, col in enumerate(cols):
+                with col:
+                    show_fields(customer, CUSTOMER_FIELDS[i::3])
+
+    st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
+
+    # ===== ITEMS TABLE =====
+    st.subheader("📋 Itemized List")
+
+    if items_table is None:
+        items_table = build_items_table(data)
+    if items_table is not None:
+        st.dataframe(
+            items_table,
+            column_config=items_column_config(items_table.columns, curr),
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.info("No items could be extracted from the receipt.")
+
+    st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
+
+    # ===== PRICING BREAKDOWN =====
+    st.subheader("💵 Pricing Summary")
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        if pricing.get("subtotal") is not None:
+            st.metric(label="Subtotal", value=f"{curr}{pricing['subtotal']:.2f}")
+        if pricing.get("discount_total") and pricing.get("discount_total") > 0:
+            st.metric(label="Discount", value=f"-{curr}{pricing['discount_total']:.2f}")
+            if pricing.get("discount_description"):
+                st.caption(f"({pricing['discount_description']})")
+
+    with col2:
+        if pricing.get("service_charge") and pricing.get("service_charge") > 0:
+            label = f"Service Charge ({pricing['service_charge_percent']}%)" if pricing.get("service_charge_percent") else "Service Charge"
+            st.metric(label=label, value=f"{curr}{pricing['service_charge']:.2f}")
+        if pricing.get("tip") and pricing.get("tip") > 0:
+            st.metric(label="Tip", value=f"{curr}{pricing['tip']:.2f}")
+        if pricing.get("delivery_fee") and pricing.get("delivery_fee") > 0:
+            st.metric(label="Delivery Fee", value=f"{curr}{pricing['delivery_fee']:.2f}")
+
+    with col3:
+        if pricing.get("total_tax") is not None:
+            st.metric(label="Total Tax", value=f"{curr}{pricing['total_tax']:.2f}")
+        total_amt = pricing.get("total_amount") or data.get("total_amount", 0)
+        if total_amt:
+            st.metric(label="💰 TOTAL", value=f"{curr}{total_amt:.2f}")
+
+    # Tax breakdown
+    taxes = [t for t in pricing.get("taxes") or [] if t.get("tax_amount")]
+    if taxes:
+        with st.expander("📊 Tax Breakdown"):
+            lines = []
+            for tax in taxes:
+                rate = f" ({tax['tax_rate']})" if tax.get("tax_rate") else ""
+                lines.append(f"**{tax.get('tax_name', 'Tax')}{rate}:** {curr}{tax['tax_amount']:.2f}")
+            st.markdown("  \n".join(lines))
+
+    # ===== PAYMENT DETAILS =====
+    if payment and any(payment.values()):
+        shown = dict(payment)
+        if payment.get("card_last_four"):
+            shown["card_last_four"] = f"****{payment['card_last_four']}"
+        for key in ("amount_tendered", "change_given"):
+            if payment.get(key):
+                shown[key] = f"{curr}{payment[key]:.2f}"
+        with st.expander("💳 Payment Details"):
+            for col, fields in zip(st.columns(3), PAYMENT_FIELDS):
+                with col:
+                    show_fields(shown, fields)
+
+    # ===== BILL-TYPE SPECIFIC SECTIONS =====
+    for key, title, columns in DETAIL_SECTIONS:
+        section = data.get(key, {}) or {}
+        if not (section and any(section.values())):
+            continue
+        with st.expander(title):
+            if len(columns) == 1:
+                show_fields(section, columns[0])
+                continue
+            for col, fields in zip(st.columns(len(columns)), columns):
+                with col:
+                    show_fields(section, fields)
+
+    # Raw JSON expander
+    with st.expander("🔍 View Raw JSON Data"):
+        st.json(data)
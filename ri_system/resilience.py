@@ -0,0 +1,282 @@
+"""Retries, backoff and adaptive concurrency around Gemini calls.
+
+`Resilience.call(fn)` runs one model call with:
+
+- error classification: throttling and transient server/network errors are
+  retried, anything else (bad request, bad key) fails immediately
+- exponential backoff with full jitter, stretched to any retry-after hint
+- a circuit breaker that stops calling a failing API for a cool-down period
+- an AIMD limiter that starts at its maximum, halves in-flight calls on
+  throttling or overload and grows them back by one per window of successful
+  calls
+
+One instance is shared by every caller in the process, so batch workers and
+interactive sessions back off together.
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLED_STATUS = {429}
+# Answers that mean we're sending too much at once; they shrink the concurrency limit
+OVERLOADED_STATUS = {429, 503}
+
+# The AIMD limiter whose slot the current thread holds, if any
+_held = threading.local()
+
+
+class CircuitOpenError(RuntimeError):
+    """Calls are paused because the API has been failing repeatedly."""
+
+
+def status_code(exc):
+    """HTTP status of an API error, or None for other exceptions."""
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc):
+    """True for throttling, transient server errors and network failures."""
+    # Imported here: only failed calls get this far, and google.genai is slow to import
+    import httpx
+    from google.genai import errors
+
+    if isinstance(exc, errors.APIError):
+        return status_code(exc) in RETRYABLE_STATUS
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def is_throttled(exc):
+    return status_code(exc) in THROTTLED_STATUS
+
+
+def is_overloaded(exc):
+    return status_code(exc) in OVERLOADED_STATUS
+
+
+def _seconds(value):
+    """Parse '17s', '1.5s' or '17' into seconds."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)s?\s*", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after(exc):
+    """Server-suggested wait in seconds (Retry-After header or RetryInfo detail), if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after"):
+        seconds = _seconds(headers["retry-after"])
+        if seconds is not None:
+            return seconds
+
+    def find(node):
+        if isinstance(node, dict):
+            if "retryDelay" in node:
+                return _seconds(node["retryDelay"])
+            node = list(node.values())
+        if isinstance(node, list):
+            for child in node:
+                seconds = find(child)
+                if seconds is not None:
+                    return seconds
+        return None
+
+    return find(getattr(exc, "details", None))
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one probe through after `reset_after` seconds."""
+
+    def __init__(self, threshold=5, reset_after=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._cond:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._clock() - self._opened_at >= self.reset_after else "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now.
+
+        Once the cool-down is over, one caller probes the API and the others wait
+        for its outcome instead of failing.
+        """
+        with self._cond:
+            while self._probing:
+                self._cond.wait()
+            if self._opened_at is None:
+                return
+            remaining = self.reset_after - (self._clock() - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Gemini is failing repeatedly; pausing requests for {max(remaining, 1):.0f}s"
+                )
+            self._probing = True
+
+    def record_success(self):
+        with self._cond:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        with self._cond:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = self._clock()
+            self._probing = False
+            self._cond.notify_all()
+
+
+class AIMDLimiter:
+    """Concurrency limit that grows additively on success and halves on throttling or overload.
+
+    Starts at `maximum` unless `initial` is given: without throttling, every
+    call the caller allows goes out at once.
+    """
+
+    def __init__(self, initial=None, minimum=1, maximum=32, cooldown=1.0, clock=time.monotonic):
+        self.limit = float(maximum if initial is None else initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self._clock = clock
+        self._in_flight = 0
+        self._last_decrease = None
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight slot for the duration of a call."""
+        self._take()
+        previous, _held.limiter = getattr(_held, "limiter", None), self
+        try:
+            yield
+        finally:
+            _held.limiter = previous
+            self._give()
+
+    def _take(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def _give(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            # +1 per `limit` successes, i.e. roughly one step per round of in-flight calls
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            now = self._clock()
+            # Calls already in flight when throttling started fail together; count them once
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+@contextmanager
+def slot_released():
+    """Hand back the calling thread's in-flight slot, if it holds one, while it waits for something else.
+
+    A call queued for its turn under a rate limit (see `ratelimit.py`) isn't in
+    flight, and holding the slot meanwhile would keep calls that could go out now waiting.
+    """
+    limiter = getattr(_held, "limiter", None)
+    if limiter is None:
+        yield
+        return
+    limiter._give()
+    try:
+        yield
+    finally:
+        limiter._take()
+
+
+class Resilience:
+    """Shared retry policy, circuit breaker and concurrency limiter for model calls."""
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=30.0, breaker=None, limiter=None,
+                 sleep=time.sleep, rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AIMDLimiter()
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+
+    def backoff(self, attempt, exc=None):
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        hint = retry_after(exc) if exc is not None else None
+        return max(delay, hint) if hint is not None else delay
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn`, retrying retryable failures; fatal errors are raised at once."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                with self.limiter.slot():
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or is_throttled(e):
+                    # The API answered: a bad request or throttling is no sign of an outage
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                if not is_retryable(e):
+                    raise
+                with self._lock:
+                    if is_throttled(e):
+                        self.throttled += 1
+                    if attempt < self.max_attempts:
+                        self.retries += 1
+                if is_overloaded(e):
+                    self.limiter.on_throttle()
+                if attempt >= self.max_attempts:
+                    raise
+                self._sleep(self.backoff(attempt, e))
+                continue
+            self.breaker.record_success()
+            self.limiter.on_success()
+            return result
+
+    def stats(self):
+        """Current limiter and breaker state plus retry counters."""
+        return {
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "circuit": self.breaker.state,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
@@ -0,0 +1,276 @@
+"""Typed schema for extracted receipts.
+
+The models below are the single definition of the receipt structure: they
+are sent to Gemini as the response schema, rendered into the JSON outline in
+the system prompt, and used to validate and coerce every response.
+"""
+import json
+import re
+import typing
+from functools import lru_cache
+from typing import Annotated, List, Literal, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, create_model
+
+__all__ = [
+    "BILL_TYPES", "BillTypeGuess", "Receipt", "ReceiptValidationError",
+    "parse_receipt", "receipt_model", "schema_outline", "sections_for",
+]
+
+BILL_TYPES = (
+    "Retail", "Restaurant", "Grocery", "Utility", "Medical", "Hotel", "Gas Station",
+    "Transportation", "Subscription", "Bank Statement", "Parking", "E-commerce", "Invoice", "Other",
+)
+
+_NUMBER_NOISE = re.compile(r"[^\d.\-]")
+
+
+def _to_number(value):
+    """Accept numbers written as strings, e.g. '$1,234.50' or '12.5 SAR'."""
+    if isinstance(value, str):
+        cleaned = _NUMBER_NOISE.sub("", value.replace(",", ""))
+        if not cleaned or cleaned in ("-", ".", "-."):
+            return None
+        return cleaned
+    return value
+
+
+Amount = Annotated[Optional[float], BeforeValidator(_to_number)]
+
+
+def _field(description):
+    return Field(default=None, description=description)
+
+
+class Section(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True, extra="ignore")
+
+
+class MerchantInfo(Section):
+    name: Optional[str] = _field("Business/Store/Company name")
+    address: Optional[str] = _field("Full address if visible")
+    phone: Optional[str] = _field("Phone number if visible")
+    email: Optional[str] = _field("Email if visible")
+    website: Optional[str] = _field("Website if visible")
+    tax_id: Optional[str] = _field("Tax ID/VAT number if visible")
+    branch: Optional[str] = _field("Branch/Location name if applicable")
+
+
+class TransactionInfo(Section):
+    date: Optional[str] = _field("Transaction date")
+    time: Optional[str] = _field("Transaction time if visible")
+    receipt_number: Optional[str] = _field("Receipt/Invoice/Order number")
+    reference_number: Optional[str] = _field("Any reference or confirmation number")
+    cashier: Optional[str] = _field("Cashier/Server name if visible")
+    terminal_id: Optional[str] = _field("POS/Terminal ID if visible")
+    table_number: Optional[str] = _field("Table number (for restaurants)")
+
+
+class CustomerInfo(Section):
+    name: Optional[str] = _field("Customer name if visible")
+    account_number: Optional[str] = _field("Account/Member number if visible")
+    address: Optional[str] = _field("Customer address if visible")
+    phone: Optional[str] = _field("Customer phone if visible")
+    email: Optional[str] = _field("Customer email if visible")
+    loyalty_points: Optional[str] = _field("Loyalty/Reward points if visible")
+
+
+class Item(Section):
+    item_name: Optional[str] = _field("Name/Description of item or service")
+    item_code: Optional[str] = _field("SKU/Product code if visible")
+    category: Optional[str] = _field("Category if identifiable")
+    quantity: Amount = _field("Quantity purchased")
+    unit: Optional[str] = _field("Unit of measurement (pcs, kg, L, etc.)")
+    unit_price: Amount = _field("Price per unit")
+    discount: Amount = _field("Discount applied to this line")
+    tax: Amount = _field("Tax charged on this line")
+    total_price: Amount = _field("Line total")
+    notes: Optional[str] = _field("Any special notes or modifiers")
+
+
+class Tax(Section):
+    tax_name: Optional[str] = _field("Tax type (VAT, GST, Sales Tax, etc.)")
+    tax_rate: Optional[str] = _field("Tax percentage if visible")
+    tax_amount: Amount = _field("Tax amount")
+
+
+class Pricing(Section):
+    subtotal: Amount = _field("Subtotal before taxes and charges")
+    discount_total: Amount = _field("Total discount")
+    discount_description: Optional[str] = _field("Discount type/code if visible")
+    service_charge: Amount = _field("Service charge amount")
+    service_charge_percent: Amount = _field("Service charge percentage")
+    tip: Amount = _field("Tip amount")
+    delivery_fee: Amount = _field("Delivery fee")
+    taxes: Optional[List[Tax]] = Field(default=None, description="Individual taxes")
+    total_tax: Amount = _field("Sum of all taxes")
+    total_amount: Amount = _field("Grand total")
+    currency: Optional[str] = _field("Currency code (USD, EUR, SAR, etc.)")
+    currency_symbol: Optional[str] = _field("Currency symbol ($, €, ر.س, etc.)")
+
+
+class Payment(Section):
+    method: Optional[str] = _field("Payment method (Cash, Credit Card, Debit Card, Mobile Payment, etc.)")
+    card_type: Optional[str] = _field("Card brand if visible (Visa, Mastercard, etc.)")
+    card_last_four: Optional[str] = _field("Last 4 digits of card if visible")
+    amount_tendered: Amount = _field("Amount tendered")
+    change_given: Amount = _field("Change given")
+    transaction_id: Optional[str] = _field("Payment transaction ID if visible")
+    approval_code: Optional[str] = _field("Approval/Auth code if visible")
+
+
+class UtilityDetails(Section):
+    account_number: Optional[str] = _field("Utility account number")
+    meter_number: Optional[str] = _field("Meter number if applicable")
+    billing_period: Optional[str] = _field("Billing period dates")
+    previous_reading: Optional[str] = _field("Previous meter reading")
+    current_reading: Optional[str] = _field("Current meter reading")
+    consumption: Optional[str] = _field("Total consumption with unit")
+    due_date: Optional[str] = _field("Payment due date")
+    late_fee: Optional[str] = _field("Late payment fee if any")
+
+
+class HotelDetails(Section):
+    guest_name: Optional[str] = _field("Guest name")
+    room_number: Optional[str] = _field("Room number")
+    check_in: Optional[str] = _field("Check-in date/time")
+    check_out: Optional[str] = _field("Check-out date/time")
+    nights: Optional[str] = _field("Number of nights")
+    room_rate: Optional[str] = _field("Nightly room rate")
+    room_type: Optional[str] = _field("Room type/category")
+
+
+class FuelDetails(Section):
+    fuel_type: Optional[str] = _field("Fuel type (Regular, Premium, Diesel, etc.)")
+    pump_number: Optional[str] = _field("Pump number")
+    liters_gallons: Optional[str] = _field("Amount of fuel")
+    price_per_unit: Optional[str] = _field("Price per liter/gallon")
+    odometer: Optional[str] = _field("Odometer reading if visible")
+    vehicle_plate: Optional[str] = _field("Vehicle plate number if visible")
+
+
+class MedicalDetails(Section):
+    patient_name: Optional[str] = _field("Patient name")
+    provider_name: Optional[str] = _field("Doctor/Provider name")
+    facility: Optional[str] = _field("Hospital/Clinic name")
+    diagnosis_codes: Optional[str] = _field("Diagnosis/ICD codes if visible")
+    insurance_info: Optional[str] = _field("Insurance details if visible")
+    insurance_paid: Optional[str] = _field("Amount paid by insurance")
+    patient_responsibility: Optional[str] = _field("Amount patient owes")
+
+
+class AdditionalInfo(Section):
+    return_policy: Optional[str] = _field("Return policy if visible")
+    warranty_info: Optional[str] = _field("Warranty information if visible")
+    barcode_data: Optional[str] = _field("Barcode number if visible")
+    qr_code_content: Optional[str] = _field("QR code content description if visible")
+    notes: Optional[str] = _field("Any other important information")
+    promotional_messages: Optional[str] = _field("Any promotional text or offers")
+
+
+class Receipt(Section):
+    bill_type: Optional[str] = _field(
+        "Type of bill (e.g., 'Restaurant', 'Retail', 'Utility', 'Medical', 'Hotel', "
+        "'Gas Station', 'Grocery', 'Transportation', 'Invoice', 'Other')"
+    )
+    merchant_info: Optional[MerchantInfo] = None
+    transaction_info: Optional[TransactionInfo] = None
+    customer_info: Optional[CustomerInfo] = None
+    items: Optional[List[Item]] = None
+    pricing: Optional[Pricing] = None
+    payment: Optional[Payment] = None
+    utility_details: Optional[UtilityDetails] = None
+    hotel_details: Optional[HotelDetails] = None
+    fuel_details: Optional[FuelDetails] = None
+    medical_details: Optional[MedicalDetails] = None
+    additional_info: Optional[AdditionalInfo] = None
+
+
+class BillTypeGuess(BaseModel):
+    """Response of the cheap classification pass."""
+
+    bill_type: Literal[BILL_TYPES] = Field(description="Type of the bill, receipt or invoice")
+
+
+# Sections every receipt gets, plus the detail section that only one bill type needs
+CORE_SECTIONS = (
+    "bill_type", "merchant_info", "transaction_info", "customer_info",
+    "items", "pricing", "payment", "additional_info",
+)
+DETAIL_SECTIONS = {
+    "Utility": "utility_details",
+    "Hotel": "hotel_details",
+    "Gas Station": "fuel_details",
+    "Medical": "medical_details",
+}
+
+
+def sections_for(bill_type):
+    """Sections worth asking for on this bill type; None means the full schema."""
+    if bill_type not in BILL_TYPES or bill_type == "Other":
+        return None
+    if bill_type in DETAIL_SECTIONS:
+        return CORE_SECTIONS + (DETAIL_SECTIONS[bill_type],)
+    return CORE_SECTIONS
+
+
+@lru_cache(maxsize=None)
+def receipt_model(sections=None):
+    """Receipt schema restricted to `sections` (a tuple of top-level field names)."""
+    if sections is None:
+        return Receipt
+    fields = {
+        name: (field.annotation, field)
+        for name, field in Receipt.model_fields.items()
+        if name in sections
+    }
+    return create_model("Receipt", __base__=Section, **fields)
+
+
+class ReceiptValidationError(ValueError):
+    """The model's response is not valid JSON or does not match the schema."""
+
+
+def _unwrap(annotation):
+    """Strip Optional[...] and return (inner type, is_list)."""
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if typing.get_origin(annotation) is typing.Union and len(args) == 1:
+        annotation = args[0]
+    if typing.get_origin(annotation) in (list, List):
+        return typing.get_args(annotation)[0], True
+    return annotation, False
+
+
+def _outline(model):
+    outline = {}
+    for name, field in model.model_fields.items():
+        inner, is_list = _unwrap(field.annotation)
+        if isinstance(inner, type) and issubclass(inner, BaseModel):
+            value = _outline(inner)
+        elif inner is float:
+            value = 0.00
+        else:
+            value = field.description
+        outline[name] = [value] if is_list else value
+    return outline
+
+
+def schema_outline(sections=None):
+    """JSON outline of the receipt for the prompt, optionally limited to `sections`."""
+    outline = _outline(Receipt)
+    if sections is not None:
+        outline = {k: v for k, v in outline.items() if k in sections}
+    return json.dumps(outline, indent=4, ensure_ascii=False)
+
+
+def parse_receipt(text):
+    """Validate a JSON response against the schema and return it as a plain dict.
+
+    Numbers written as strings are coerced, unknown keys are dropped and empty
+    (null) fields are omitted. Raises ReceiptValidationError on failure.
+    """
+    try:
+        receipt = Receipt.model_validate_json(text)
+    except ValidationError as e:
+        raise ReceiptValidationError(str(e)) from e
+    return receipt.model_dump(exclude_none=True)
@@ -0,0 +1,330 @@
+"""Persistent, indexed store of extracted receipts.
+
+Extraction results are normalized into SQLite tables (receipts, items,
+taxes, payments) so spend questions can be answered with indexed queries
+instead of re-analyzing images. The raw JSON is kept alongside so a stored
+receipt can be displayed again exactly as it was extracted.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_DATA_DIR = os.environ.get(
+    "RI_DATA_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "ri-system")
+)
+
+# Tried in order; month-first wins over day-first when both parse
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y",
+    "%d.%m.%Y", "%m/%d/%y", "%d/%m/%y", "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y",
+    "%b %d %Y", "%d-%b-%Y", "%d-%b-%y",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    image_hash TEXT UNIQUE,
+    file_name TEXT,
+    bill_type TEXT,
+    merchant_name TEXT,
+    merchant_key TEXT,
+    txn_date TEXT,
+    raw_date TEXT,
+    currency TEXT,
+    subtotal REAL,
+    total_tax REAL,
+    total REAL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_receipts_merchant ON receipts (merchant_key);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (txn_date);
+CREATE INDEX IF NOT EXISTS idx_receipts_bill_type ON receipts (bill_type, txn_date);
+CREATE INDEX IF NOT EXISTS idx_receipts_total ON receipts (total, currency);
+
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+    line_no INTEGER NOT NULL,
+    item_name TEXT,
+    item_code TEXT,
+    category TEXT,
+    quantity REAL,
+    unit TEXT,
+    unit_price REAL,
+    discount REAL,
+    tax REAL,
+    total_price REAL
+);
+CREATE INDEX IF NOT EXISTS idx_items_receipt ON items (receipt_id);
+
+CREATE TABLE IF NOT EXISTS taxes (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+    tax_name TEXT,
+    tax_rate TEXT,
+    tax_amount REAL
+);
+CREATE INDEX IF NOT EXISTS idx_taxes_receipt ON taxes (receipt_id);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+    method TEXT,
+    card_type TEXT,
+    card_last_four TEXT,
+    amount_tendered REAL,
+    change_given REAL,
+    transaction_id TEXT,
+    approval_code TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payments_receipt ON payments (receipt_id);
+"""
+
+ITEM_FIELDS = (
+    "item_name", "item_code", "category", "quantity", "unit",
+    "unit_price", "discount", "tax", "total_price",
+)
+TAX_FIELDS = ("tax_name", "tax_rate", "tax_amount")
+PAYMENT_FIELDS = (
+    "method", "card_type", "card_last_four", "amount_tendered",
+    "change_given", "transaction_id", "approval_code",
+)
+
+
+def normalize_date(value):
+    """Best-effort ISO date (YYYY-MM-DD) from a receipt date string, else None."""
+    if not value:
+        return None
+    text = str(value).strip()
+    # Also try without a trailing time, e.g. "15 Mar 2024 14:22" or "2024-03-01T14:22:00"
+    words = [w for w in text.split() if ":" not in w and w.upper() not in ("AM", "PM")]
+    candidates = (text, text.split("T")[0], " ".join(words))
+    for candidate in dict.fromkeys(candidates):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).date().isoformat()
+            except ValueError:
+                continue
+    return None
+
+
+def merchant_key(name):
+    """Case- and whitespace-insensitive merchant lookup key."""
+    return " ".join(str(name).lower().split()) if name else None
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ReceiptStore:
+    """SQLite-backed store of normalized receipts."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_DATA_DIR, "receipts.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(receipts)")}
+            if "phash" not in columns:
+                # Stores created before near-duplicate detection
+                self._conn.execute("ALTER TABLE receipts ADD COLUMN phash TEXT")
+
+    def add(self, data, image_hash=None, file_name=None, phash=None):
+        """Store one receipt and return its id."""
+        return self.add_many([(data, image_hash, file_name, phash)])[0]
+
+    def add_many(self, records):
+        """Store `(data, image_hash, file_name[, phash])` records in a single transaction.
+
+        A receipt whose image hash is already stored is replaced, so re-analyzing
+        an image never creates duplicates; within one call the last record with
+        a given image hash wins. Returns one receipt id per record, records
+        sharing an image hash sharing the id.
+        """
+        now = time.time()
+        ids, items, taxes, payments = [], [], [], []
+        with self._lock, self._conn:
+            records = [(*record, None)[:4] for record in records]
+            # Index of the record kept for each image hash
+            last = {r[1]: i for i, r in enumerate(records) if r[1]}
+            hashes = list(last)
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                self._conn.execute(
+                    f"DELETE FROM receipts WHERE image_hash IN ({','.join('?' * len(chunk))})", chunk
+                )
+            for i, (data, image_hash, file_name, phash) in enumerate(records):
+                if image_hash and last[image_hash] != i:
+                    ids.append(None)
+                    continue
+                merchant = data.get("merchant_info") or {}
+                transaction = data.get("transaction_info") or {}
+                pricing = data.get("pricing") or {}
+                cursor = self._conn.execute(
+                    "INSERT INTO receipts (image_hash, file_name, bill_type, merchant_name, merchant_key, "
+                    "txn_date, raw_date, currency, subtotal, total_tax, total, created_at, data, phash) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        image_hash,
+                        file_name,
+                        data.get("bill_type"),
+                        merchant.get("name"),
+                        merchant_key(merchant.get("name")),
+                        normalize_date(transaction.get("date")),
+                        transaction.get("date"),
+                        pricing.get("currency"),
+                        _number(pricing.get("subtotal")),
+                        _number(pricing.get("total_tax")),
+                        _number(pricing.get("total_amount")),
+                        now,
+                        json.dumps(data, ensure_ascii=False),
+                        phash,
+                    ),
+                )
+                receipt_id = cursor.lastrowid
+                ids.append(receipt_id)
+                for line_no, item in enumerate(data.get("items") or []):
+                    items.append((receipt_id, line_no) + tuple(item.get(f) for f in ITEM_FIELDS))
+                for tax in pricing.get("taxes") or []:
+                    taxes.append((receipt_id,) + tuple(tax.get(f) for f in TAX_FIELDS))
+                payment = data.get("payment") or {}
+                if any(payment.values()):
+                    payments.append((receipt_id,) + tuple(payment.get(f) for f in PAYMENT_FIELDS))
+            # Replaced records take the id of the one kept for their image hash
+            ids = [ids[last[r[1]]] if receipt_id is None else receipt_id for receipt_id, r in zip(ids, records)]
+
+            self._conn.executemany(
+                f"INSERT INTO items (receipt_id, line_no, {', '.join(ITEM_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(ITEM_FIELDS) + 2))})",
+                items,
+            )
+            self._conn.executemany(
+                f"INSERT INTO taxes (receipt_id, {', '.join(TAX_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(TAX_FIELDS) + 1))})",
+                taxes,
+            )
+            self._conn.executemany(
+                f"INSERT INTO payments (receipt_id, {', '.join(PAYMENT_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(PAYMENT_FIELDS) + 1))})",
+                payments,
+            )
+        return ids
+
+    def _where(self, merchant=None, date_from=None, date_to=None, bill_type=None,
+               min_total=None, max_total=None):
+        clauses, params = [], []
+        # A merchant prefix is far more selective than a date range; the unary
+        # plus keeps SQLite from picking the date index over the merchant one
+        date_column = "+txn_date" if merchant else "txn_date"
+        if merchant:
+            # Prefix match on the normalized key as a range, so the index is used
+            key = merchant_key(merchant)
+            clauses.append("merchant_key >= ? AND merchant_key < ?")
+            params += [key, key + "\uffff"]
+        if date_from:
+            clauses.append(f"{date_column} >= ?")
+            params.append(str(date_from))
+        if date_to:
+            clauses.append(f"{date_column} <= ?")
+            params.append(str(date_to))
+        if bill_type:
+            clauses.append("bill_type = ?")
+            params.append(bill_type)
+        if min_total is not None:
+            clauses.append("total >= ?")
+            params.append(min_total)
+        if max_total is not None:
+            clauses.append("total <= ?")
+            params.append(max_total)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, limit=200, **filters):
+        """Receipts matching the filters, newest transaction first.
+
+        Filters: merchant (prefix, case-insensitive), date_from/date_to (ISO
+        dates, inclusive), bill_type, min_total/max_total.
+        """
+        where, params = self._where(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, file_name, bill_type, merchant_name, txn_date, raw_date, currency, "
+                f"subtotal, total_tax, total FROM receipts{where} "
+                "ORDER BY txn_date DESC, id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def summary(self, **filters):
+        """Receipt count and total spend per currency for the filters."""
+        where, params = self._where(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT currency, COUNT(*) AS receipts, SUM(total) AS total FROM receipts{where} "
+                "GROUP BY currency ORDER BY total DESC",
+                params,
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get(self, receipt_id):
+        """Full extracted JSON of a stored receipt, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM receipts WHERE id = ?", (receipt_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def exists(self, receipt_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM receipts WHERE id = ?", (receipt_id,)).fetchone() is not None
+
+    def phashes(self):
+        """`(receipt_id, phash)` for every receipt with a perceptual hash."""
+        with self._lock:
+            return [tuple(r) for r in self._conn.execute("SELECT id, phash FROM receipts WHERE phash IS NOT NULL")]
+
+    def summary_of(self, receipt_id):
+        """Merchant, date and total of one stored receipt, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, image_hash, file_name, merchant_name, raw_date, currency, total FROM receipts WHERE id = ?",
+                (receipt_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def bill_types(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT bill_type FROM receipts WHERE bill_type IS NOT NULL ORDER BY bill_type"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def version(self):
+        """Changes whenever receipts are added or replaced; cheap to call on every rerun."""
+        with self._lock:
+            return tuple(self._conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM receipts").fetchone())
+
+    def select(self, sql, params=()):
+        """Run a read-only query; returns (column names, rows as tuples)."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = None  # plain tuples build DataFrames faster than Row objects
+            cursor.execute(sql, params)
+            return [c[0] for c in cursor.description], cursor.fetchall()
@@ -0,0 +1,149 @@
+"""Tall receipt photos: split into overlapping tiles, extract tiles concurrently, merge.
+
+A 2–3 m pharmacy or grocery receipt photographed in one image is many times
+taller than it is wide. Shrunk to the model's input size as a whole, its
+lines become unreadable and items go missing. Cut into tiles not much
+taller than they are wide, every line stays legible. Tiles overlap so that each line
+is whole in at least one tile; the items read twice in an overlap are
+removed when the tiles are merged.
+"""
+import io
+import math
+import re
+from difflib import SequenceMatcher
+
+from PIL import Image, ImageOps
+
+from .pdf import merge_pages
+
+EXIF_ORIENTATION = 0x0112
+# Height/width above which an image is split
+TALL_ASPECT = 3.0
+# Tile height as a multiple of the width, and the share of each tile repeated in the next
+TILE_ASPECT = 1.5
+OVERLAP = 0.2
+# Longer receipts get taller tiles rather than more calls: all tiles fit in one round of
+# requests under the default concurrency limit, so a receipt takes about as long as one call
+MAX_TILES = 8
+# Items compared at a tile boundary; an overlap holds a handful of receipt lines
+MAX_OVERLAP_ITEMS = 10
+NAME_SIMILARITY = 0.8
+TILE_QUALITY = 95
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def image_size(image_bytes):
+    """Width and height of an image as displayed (after EXIF rotation), reading only its header."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+            return height, width
+    return width, height
+
+
+def is_tall(image_bytes, aspect=TALL_ASPECT):
+    """True for images at least `aspect` times taller than wide (False if unreadable)."""
+    try:
+        width, height = image_size(image_bytes)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return height >= aspect * width
+
+
+def tile_bounds(width, height, tile_aspect=TILE_ASPECT, overlap=OVERLAP, max_tiles=MAX_TILES):
+    """`(top, bottom)` of each tile, top to bottom; the last tile ends at the bottom edge."""
+    tile_height = max(1, int(width * tile_aspect))
+    if tile_height >= height:
+        return [(0, height)]
+    count = math.ceil((height - tile_height) / (tile_height * (1 - overlap))) + 1
+    if count > max_tiles:
+        # height = tile_height * (1 + (count - 1) * (1 - overlap))
+        count = max_tiles
+        tile_height = math.ceil(height / (1 + (count - 1) * (1 - overlap)))
+    step = (height - tile_height) / (count - 1)
+    return [(round(i * step), round(i * step) + tile_height) for i in range(count)]
+
+
+def split_tiles(image_bytes, **kwargs):
+    """The upright image cut into overlapping horizontal tiles, each as JPEG bytes.
+
+    Keyword arguments go to `tile_bounds`. Raises OSError for unreadable images.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        tiles = []
+        for top, bottom in tile_bounds(*image.size, **kwargs):
+            buffer = io.BytesIO()
+            image.crop((0, top, image.width, bottom)).save(buffer, "JPEG", quality=TILE_QUALITY)
+            tiles.append(buffer.getvalue())
+    return tiles
+
+
+def _name(item):
+    return _NON_WORD.sub(" ", str(item.get("item_name") or "").lower()).strip()
+
+
+def same_item(a, b):
+    """Whether two items read from neighbouring tiles are the same receipt line.
+
+    Prices must agree when both were read. Names must be near-identical, or one
+    a prefix of the other, since a line cut at a tile edge reads short.
+    """
+    price_a, price_b = a.get("total_price"), b.get("total_price")
+    if price_a is not None and price_b is not None and abs(price_a - price_b) > 0.005:
+        return False
+    name_a, name_b = _name(a), _name(b)
+    if not name_a or not name_b:
+        return price_a is not None and price_b is not None
+    if min(len(name_a), len(name_b)) >= 3 and (name_a.startswith(name_b) or name_b.startswith(name_a)):
+        return True
+    return SequenceMatcher(None, name_a, name_b).ratio() >= NAME_SIMILARITY
+
+
+def overlap_length(above, below, max_items=MAX_OVERLAP_ITEMS):
+    """How many of the last items of `above` are the first items of `below` (0 if none)."""
+    for k in range(min(len(above), len(below), max_items), 0, -1):
+        if all(same_item(a, b) for a, b in zip(above[-k:], below[:k])):
+            return k
+    return 0
+
+
+def _fuller(a, b):
+    """Of two readings of one line, the one with more fields filled in."""
+    return a if sum(v is not None for v in a.values()) >= sum(v is not None for v in b.values()) else b
+
+
+def merge_tiles(tiles):
+    """Combine per-tile receipt dicts (top to bottom, None for missing tiles) into one receipt.
+
+    Items are concatenated with the lines read twice in an overlap kept once.
+    The header sections come from the topmost tile that has them and pricing
+    from the lowest tile with a total (see `pdf.merge_pages`); payment, printed
+    at the bottom too, from the lowest tile that has it.
+    """
+    tiles = [tile for tile in tiles if tile]
+    items, previous = [], []
+    for tile in tiles:
+        tile_items = [item for item in tile.get("items") or [] if isinstance(item, dict)]
+        k = overlap_length(previous, tile_items)
+        for j in range(k):
+            items[len(items) - k + j] = _fuller(items[len(items) - k + j], tile_items[j])
+        items.extend(tile_items[k:])
+        previous = tile_items
+
+    merged = merge_pages(tiles)
+    payment = {}
+    for tile in reversed(tiles):
+        for field, value in (tile.get("payment") or {}).items():
+            if payment.get(field) is None:
+                payment[field] = value
+    if payment:
+        merged["payment"] = payment
+    if items:
+        merged["items"] = items
+    else:
+        merged.pop("items", None)
+    return merged
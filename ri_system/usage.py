@@ -0,0 +1,83 @@
+"""Token and latency accounting per extraction mode and model tier."""
+import threading
+from collections import defaultdict
+
+
+def add_usage(totals, response):
+    """Add a response's `usage_metadata` token counts into `totals` (a dict)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return totals
+    totals["prompt_tokens"] = totals.get("prompt_tokens", 0) + (usage.prompt_token_count or 0)
+    totals["response_tokens"] = totals.get("response_tokens", 0) + (usage.candidates_token_count or 0)
+    totals["calls"] = totals.get("calls", 0) + 1
+    return totals
+
+
+class UsageStats:
+    """Thread-safe running totals of tokens and latency per mode, and of outcomes per model tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = defaultdict(lambda: {
+            "receipts": 0, "calls": 0, "prompt_tokens": 0, "response_tokens": 0, "seconds": 0.0,
+        })
+        # Per model: receipts it finished, their latency, attempts, and per check (passed, checked)
+        self._tiers = defaultdict(lambda: {
+            "receipts": 0, "seconds": 0.0, "attempts": 0, "checks": defaultdict(lambda: [0, 0]),
+        })
+
+    def record(self, mode, totals, seconds):
+        """Record one analyzed receipt with its summed token counts."""
+        with self._lock:
+            stats = self._modes[mode]
+            stats["receipts"] += 1
+            stats["calls"] += totals.get("calls", 0)
+            stats["prompt_tokens"] += totals.get("prompt_tokens", 0)
+            stats["response_tokens"] += totals.get("response_tokens", 0)
+            stats["seconds"] += seconds
+            attempts = totals.get("attempts") or []
+            for attempt in attempts:
+                tier = self._tiers[attempt["model"]]
+                tier["attempts"] += 1
+                for check, passed in attempt["checks"].items():
+                    if passed is not None:
+                        tier["checks"][check][0] += passed
+                        tier["checks"][check][1] += 1
+            if attempts:
+                self._tiers[attempts[-1]["model"]]["receipts"] += 1
+                self._tiers[attempts[-1]["model"]]["seconds"] += seconds
+
+    def summary(self):
+        """Per-mode averages per receipt, as a list of dicts."""
+        with self._lock:
+            rows = []
+            for mode, stats in self._modes.items():
+                n = stats["receipts"] or 1
+                rows.append({
+                    "Mode": mode,
+                    "Receipts": stats["receipts"],
+                    "Calls": round(stats["calls"] / n, 2),
+                    "Prompt tokens": round(stats["prompt_tokens"] / n),
+                    "Response tokens": round(stats["response_tokens"] / n),
+                    "Latency (s)": round(stats["seconds"] / n, 2),
+                })
+            return rows
+
+    def tiers(self):
+        """Per model: share of receipts it finished, their latency, and reconciliation pass rates (%)."""
+        with self._lock:
+            finished = sum(tier["receipts"] for tier in self._tiers.values()) or 1
+            rows = []
+            for model, tier in self._tiers.items():
+                row = {
+                    "Model": model,
+                    "Receipts": tier["receipts"],
+                    "Share (%)": round(100 * tier["receipts"] / finished),
+                    "Latency (s)": round(tier["seconds"] / tier["receipts"], 2) if tier["receipts"] else None,
+                    "Attempts": tier["attempts"],
+                }
+                for check, (passed, checked) in sorted(tier["checks"].items()):
+                    row[f"{check.title()} ✓ (%)"] = round(100 * passed / checked)
+                rows.append(row)
+            return rows
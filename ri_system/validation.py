@@ -0,0 +1,115 @@
+"""Local arithmetic checks on extracted receipts.
+
+A receipt whose numbers add up was almost certainly read correctly, so these
+checks decide whether a cheap model's answer can be kept or the receipt has
+to go to a stronger model:
+
+- items: line totals sum to the subtotal
+- total: subtotal plus taxes, service charge, tip and delivery fee, minus
+  discounts, equals the grand total
+- taxes: the individual tax entries sum to `total_tax`
+
+A check is None when the receipt lacks the numbers it needs. Receipts print
+amounts in different ways (line totals before or after line discounts, prices
+including tax, subtotals after discounts), so each check accepts any of the
+usual readings.
+"""
+from itertools import product
+
+CHECKS = ("items", "total", "taxes")
+# Rounding on the receipt itself: up to a cent per amount that went into a sum
+TOLERANCE = 0.01
+# Below this mean token log-probability the model was guessing; Gemini reports it on some responses
+MIN_AVG_LOGPROB = -1.0
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _close(value, expected, terms=1):
+    return round(abs(value - expected), 6) <= TOLERANCE * max(terms, 1)
+
+
+def _line_amounts(item):
+    """One line's amount under each reading: as printed, minus its discount, plus its tax."""
+    total = _number(item.get("total_price"))
+    if total is None:
+        quantity, unit_price = _number(item.get("quantity")), _number(item.get("unit_price"))
+        if unit_price is None:
+            return None
+        total = unit_price * (quantity if quantity is not None else 1)
+    discount, tax = _number(item.get("discount")) or 0, _number(item.get("tax")) or 0
+    return total, total - abs(discount), total + tax
+
+
+def item_sums(items):
+    """The sum of the line items under each reading, or None if a line has no amount."""
+    amounts = [_line_amounts(item) for item in items if isinstance(item, dict)]
+    if not amounts or None in amounts:
+        return None
+    return {sum(line[reading] for line in amounts) for reading in range(3)}
+
+
+def reconcile(data):
+    """Run the checks on a receipt dict; returns `{"checks": {name: True/False/None}, "issues": [...]}`."""
+    pricing = data.get("pricing") or {}
+    symbol = pricing.get("currency_symbol") or ""
+    checks = dict.fromkeys(CHECKS)
+    issues = []
+
+    subtotal = _number(pricing.get("subtotal"))
+    items = data.get("items") or []
+    sums = item_sums(items) if items else None
+    if sums and subtotal is not None:
+        checks["items"] = any(_close(s, subtotal, len(items)) for s in sums)
+        if not checks["items"]:
+            closest = min(sums, key=lambda s: abs(s - subtotal))
+            issues.append(
+                f"Items add up to {symbol}{closest:,.2f}, but the subtotal is {symbol}{subtotal:,.2f}"
+            )
+
+    taxes = [_number(t.get("tax_amount")) for t in pricing.get("taxes") or [] if isinstance(t, dict)]
+    taxes = [t for t in taxes if t is not None]
+    total_tax = _number(pricing.get("total_tax"))
+    if taxes and total_tax is not None:
+        checks["taxes"] = _close(sum(taxes), total_tax, len(taxes))
+        if not checks["taxes"]:
+            issues.append(
+                f"Taxes add up to {symbol}{sum(taxes):,.2f}, but total tax is {symbol}{total_tax:,.2f}"
+            )
+    if total_tax is None and taxes:
+        total_tax = sum(taxes)
+
+    total = _number(pricing.get("total_amount"))
+    base = subtotal
+    if base is None and sums and total is not None:
+        # No subtotal printed: the items are the subtotal
+        base = min(sums, key=lambda s: abs(s - total))
+    if base is not None and total is not None:
+        charges = sum(_number(pricing.get(f)) or 0 for f in ("service_charge", "tip", "delivery_fee"))
+        discount = abs(_number(pricing.get("discount_total")) or 0)
+        # Tax added on top or already in the prices; discount taken off or already in the subtotal
+        expected = {
+            base + charges + tax - discount_off
+            for tax, discount_off in product({total_tax or 0, 0}, {discount, 0})
+        }
+        # Subtotal, tax, three charges and the discount, each rounded
+        checks["total"] = any(_close(total, e, terms=6) for e in expected)
+        if not checks["total"]:
+            closest = min(expected, key=lambda e: abs(e - total))
+            issues.append(
+                f"Subtotal, taxes and charges come to {symbol}{closest:,.2f}, but the total is {symbol}{total:,.2f}"
+            )
+    return {"checks": checks, "issues": issues}
+
+
+def escalation_reasons(data, report=None, avg_logprobs=None):
+    """Why a result should go to a stronger model (an empty list means keep it)."""
+    report = report or reconcile(data)
+    reasons = list(report["issues"])
+    if _number((data.get("pricing") or {}).get("total_amount")) is None:
+        reasons.append("No total amount was read")
+    if avg_logprobs is not None and avg_logprobs < MIN_AVG_LOGPROB:
+        reasons.append(f"Low model confidence (mean log-probability {avg_logprobs:.2f})")
+    return reasons
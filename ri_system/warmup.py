@@ -0,0 +1,48 @@
+"""Background preloading of the modules the first page doesn't need.
+
+google.genai and pandas take most of a second to import together, so they
+are imported on first use: genai when an analysis builds its request, pandas
+when a table is rendered. Left at that, the first analysis after a start
+would pay for both. `start()` imports them on a daemon thread once the first
+page has been sent, while the user is still picking a file; a script that
+needs a module before then simply waits for the import in progress.
+
+`start_from_env()` does nothing when `RI_WARMUP` is `0`.
+"""
+import importlib
+import os
+import threading
+import time
+
+# In the order they are needed: the request is built before any table is shown
+HEAVY_MODULES = ("google.genai", "pandas")
+
+
+def preload(modules=HEAVY_MODULES):
+    """Import `modules` and build the default request config; returns the seconds taken per step."""
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - started
+    if "google.genai" in modules:
+        from .extraction import generation_config
+
+        started = time.perf_counter()
+        generation_config()
+        timings["generation_config"] = time.perf_counter() - started
+    return timings
+
+
+def start(modules=HEAVY_MODULES):
+    """Run `preload(modules)` on a daemon thread named "warm-up" and return the thread."""
+    thread = threading.Thread(target=preload, args=(modules,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_from_env():
+    """Start the warm-up unless `RI_WARMUP=0`; returns the thread, or None."""
+    if os.environ.get("RI_WARMUP", "1") == "0":
+        return None
+    return start()
@@ -0,0 +1,123 @@
+"""Streamed JSON in `ri_system.jsonstream`: partial values, chunking and parse work.
+
+`StreamingJSON` parses each chunk once and keeps its state in between, so it
+is checked against `parse_partial` on the whole text at every chunk boundary.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ri_system.jsonstream import StreamingJSON, parse_partial  # noqa: E402
+
+RECEIPT = {
+    "bill_type": "Restaurant",
+    "merchant_info": {"name": "Café \"Nord\"", "address": "1 Quay St\\Unit 2", "phone": None},
+    "items": [
+        {"item_name": "Flat white ☕", "quantity": 2, "unit_price": 4.5, "total_price": 9.0},
+        {"item_name": "Croissant", "quantity": 1, "unit_price": 3.25, "total_price": 3.25, "notes": ""},
+        {"item_name": "Tap water", "quantity": 1, "unit_price": 0, "total_price": -0.0, "tags": []},
+    ],
+    "pricing": {"subtotal": 12.25, "total_amount": 1.225e1, "currency_symbol": None, "paid": True},
+    "additional_info": {"notes": "Line one\nline two\ttabbed"},
+}
+
+
+def folio(n_items):
+    """A receipt with `n_items` line items, as a hotel folio streams them."""
+    items = [
+        {"item_name": f"Line item {i}", "quantity": 1 + i % 3, "unit_price": 12.5, "total_price": 12.5 * (1 + i % 3)}
+        for i in range(n_items)
+    ]
+    return {"bill_type": "Hotel/Accommodation", "items": items, "pricing": {"total_amount": 1234.5}}
+
+
+def chunked(text, sizes):
+    pos = 0
+    while pos < len(text):
+        size = sizes()
+        yield text[pos:pos + size]
+        pos += size
+
+
+def stream(text, sizes):
+    parsed = StreamingJSON()
+    for chunk in chunked(text, sizes):
+        parsed.feed(chunk)
+    return parsed
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_prefix_matches_parse_partial(indent):
+    text = "```json\n" + json.dumps(RECEIPT, indent=indent, ensure_ascii=False) + "\n```"
+    parsed = StreamingJSON()
+    for end in range(1, len(text) + 1):
+        parsed.feed(text[end - 1])
+        assert parsed.value == parse_partial(text[:end]), text[:end]
+    assert parsed.value == RECEIPT
+    assert parsed.text == text
+
+
+def test_random_chunks_match_parse_partial():
+    rng = random.Random(0)
+    text = json.dumps(RECEIPT)
+    for _ in range(50):
+        parsed = StreamingJSON()
+        seen = ""
+        for chunk in chunked(text, lambda: rng.randint(1, 40)):
+            changed = parsed.feed(chunk)
+            previous, seen = parse_partial(seen) if seen else None, seen + chunk
+            assert parsed.value == parse_partial(seen)
+            assert changed == (parsed.value != previous)
+        assert parsed.value == RECEIPT
+
+
+def test_scalars_appear_only_once_complete():
+    parsed = StreamingJSON()
+    assert parsed.feed('{"total": 12')
+    assert parsed.value == {}
+    assert not parsed.feed(".5")
+    assert parsed.feed(', "name": "Caf')
+    assert parsed.value == {"total": 12.5}
+    assert parsed.feed('e", "items": [{"x": tr')
+    assert parsed.value == {"total": 12.5, "name": "Cafe", "items": [{}]}
+
+
+def test_earlier_values_are_not_changed_by_later_chunks():
+    parsed = StreamingJSON()
+    parsed.feed('{"items": [{"a": 1}, {"b": ')
+    first = parsed.value
+    parsed.feed('2}, {"c": 3}], "d": 4}')
+
+    assert first == {"items": [{"a": 1}, {}]}
+    assert parsed.value == {"items": [{"a": 1}, {"b": 2}, {"c": 3}], "d": 4}
+    # Closed containers are shared between snapshots rather than copied
+    assert parsed.value["items"][0] is first["items"][0]
+
+
+def test_invalid_tokens_raise():
+    with pytest.raises(ValueError):
+        stream('{"a": nope}', lambda: 3)
+    with pytest.raises(ValueError):
+        stream('{"a" 1}', lambda: 3)
+
+
+def test_parse_work_grows_linearly_with_the_stream():
+    def parse_time(n_items):
+        text = json.dumps(folio(n_items))
+        best = float("inf")
+        for _ in range(3):
+            started = time.process_time()
+            parsed = stream(text, lambda: 200)
+            best = min(best, time.process_time() - started)
+        assert parsed.value == folio(n_items)
+        return best
+
+    small, large = parse_time(500), parse_time(2000)
+    # Four times the text: four times the work when parsing resumes, sixteen when it restarts per chunk
+    assert large < 8 * small + 0.05
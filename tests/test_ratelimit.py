@@ -0,0 +1,234 @@
+"""Per-key rate limits in `ri_system.ratelimit`: token buckets, fair turns, wait estimates.
+
+The limiters run on a fake clock that only moves when a test advances it.
+Waiting callers are real threads, but they are woken by the test rather than
+by the passage of time, so nothing depends on how fast the machine is.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ri_system.backends import estimate_prompt_tokens  # noqa: E402
+from ri_system.ratelimit import RateLimitedClient, RateLimiter, TokenBucket  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=5.0):
+    """Spin until `condition()` holds; the other threads only need to be scheduled, not time to pass."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def advance(limiter, clock, seconds):
+    """Move the fake clock and wake the callers waiting in `acquire`."""
+    clock.now += seconds
+    with limiter._cond:
+        limiter._cond.notify_all()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_bucket_allows_its_limit_per_period_and_no_more(clock):
+    bucket = TokenBucket(600, period=60, burst=0.1, clock=clock)
+    assert bucket.capacity == 60
+    assert bucket.rate == 9
+
+    taken = 0
+    while clock.now + bucket.wait_time(1) <= 60:
+        clock.now += bucket.wait_time(1)
+        bucket.take(1)
+        taken += 1
+    # The burst, then the steady refill: the limit over the first period and no more
+    assert 599 <= taken <= 600
+
+
+def test_bucket_wait_time(clock):
+    bucket = TokenBucket(600, period=60, burst=0.1, clock=clock)
+    bucket.take(60)
+    assert bucket.wait_time(9) == pytest.approx(1.0)
+    # Larger than the bucket: waits for a full bucket, then goes negative
+    assert bucket.wait_time(1000) == pytest.approx(60 / 9)
+
+    clock.now += 1.0
+    assert bucket.level() == pytest.approx(9)
+    assert bucket.wait_time(9) == 0
+
+
+def test_acquire_without_contention_does_not_wait(clock):
+    limiter = RateLimiter(rpm=100, tpm=10_000, clock=clock)
+
+    assert limiter.acquire(500, owner="a") == 0
+    stats = limiter.stats()
+    assert stats["calls"] == 1
+    assert stats["delayed"] == 0
+    assert stats["requests_available"] == 9
+    assert stats["tokens_available"] == 500
+
+
+def test_disabled_limits_never_wait(clock):
+    limiter = RateLimiter(rpm=0, tpm=0, clock=clock)
+
+    for _ in range(1000):
+        assert limiter.acquire(10_000) == 0
+    assert limiter.expected_wait("a", 10_000) == 0
+
+
+def test_settle_corrects_the_token_estimate(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000, clock=clock)
+    limiter.acquire(60)
+    assert limiter.tokens.level() == pytest.approx(40)
+
+    # Billed more than estimated
+    limiter.settle(60, 80)
+    assert limiter.tokens.level() == pytest.approx(20)
+    # Billed less
+    limiter.settle(60, 30)
+    assert limiter.tokens.level() == pytest.approx(50)
+    # No usage reported: the estimate stands
+    limiter.settle(60, None)
+    assert limiter.tokens.level() == pytest.approx(50)
+
+
+def test_expected_wait_of_an_idle_owner(clock):
+    limiter = RateLimiter(rpm=10, tpm=0, period=60, clock=clock)
+    limiter.acquire(owner="a")
+    per_request = 60 / 9
+
+    assert limiter.expected_wait("b") == pytest.approx(per_request)
+    clock.now += per_request / 2
+    assert limiter.expected_wait("b") == pytest.approx(per_request / 2)
+
+
+def test_expected_wait_counts_tokens(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000, period=60, clock=clock)
+    limiter.acquire(100)
+
+    # 15 tokens a second refill the bucket
+    assert limiter.expected_wait("a", tokens=30) == pytest.approx(2.0)
+
+
+def test_owners_take_turns(clock):
+    # One request in the bucket, then one every 60 / 9 seconds
+    limiter = RateLimiter(rpm=10, tpm=0, period=60, clock=clock)
+    per_request = 60 / 9
+    limiter.acquire(owner="batch")
+    served = []
+
+    def call(owner):
+        limiter.acquire(owner=owner)
+        served.append(owner)
+
+    threads = []
+    for i in range(5):
+        threads.append(threading.Thread(target=call, args=("batch",), daemon=True))
+        threads[-1].start()
+        wait_until(lambda: limiter.queued("batch") == i + 1)
+
+    # One call of each owner ahead in the rotation goes first, not all five of the batch's
+    assert limiter.expected_wait("user") == pytest.approx(2 * per_request)
+
+    threads.append(threading.Thread(target=call, args=("user",), daemon=True))
+    threads[-1].start()
+    wait_until(lambda: limiter.queued("user") == 1)
+    assert limiter.stats()["waiting"] == 6
+
+    for done in range(1, 7):
+        # A hair over one request's refill, so rounding never leaves the bucket just short
+        advance(limiter, clock, per_request + 1e-6)
+        wait_until(lambda: len(served) == done)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert served == ["batch", "user", "batch", "batch", "batch", "batch"]
+    stats = limiter.stats()
+    assert stats["waiting"] == 0
+    assert stats["delayed"] == 6
+
+
+def test_client_waits_its_turn_and_settles_the_billed_tokens(clock):
+    billed = 700
+
+    class Models:
+        def generate_content(self, model, contents, config=None):
+            return SimpleNamespace(text="{}", usage_metadata=SimpleNamespace(prompt_token_count=billed))
+
+    limiter = RateLimiter(rpm=0, tpm=10_000, clock=clock)
+    client = RateLimitedClient(SimpleNamespace(models=Models()), limiter, owner="session")
+    contents = [SimpleNamespace(text="Extract this receipt. " * 20)]
+    assert estimate_prompt_tokens(contents) != billed
+
+    client.models.generate_content(model="fake", contents=contents)
+    assert limiter.tokens.level() == pytest.approx(1000 - billed)
+    assert client.expected_wait() == 0
+
+
+def test_sessions_sharing_a_key_stay_under_the_quota_and_all_get_served(clock):
+    rpm, period = 30, 60
+    limiter = RateLimiter(rpm=rpm, tpm=0, period=period, clock=clock)
+    calls = []
+
+    class Models:
+        def generate_content(self, model, contents, config=None):
+            calls.append((clock.now, contents[0].text))
+            return SimpleNamespace(text="{}", usage_metadata=None)
+
+    backend = SimpleNamespace(models=Models())
+    # A batch session with many receipts in flight next to interactive sessions with a few
+    sessions = {"batch": 40, "alice": 5, "bob": 5, "carol": 1}
+    clients = {owner: RateLimitedClient(backend, limiter, owner=owner) for owner in sessions}
+    total = sum(sessions.values())
+
+    def call(owner):
+        clients[owner].models.generate_content(model="fake", contents=[SimpleNamespace(text=owner)])
+
+    # Use up the burst, so every session's calls queue before any is served
+    while limiter.stats()["requests_available"]:
+        call("batch")
+    burst = len(calls)
+    threads = []
+    for owner, count in sessions.items():
+        for _ in range(count):
+            threads.append(threading.Thread(target=call, args=(owner,), daemon=True))
+            threads[-1].start()
+            wait_until(lambda: limiter.stats()["waiting"] == len(threads))
+
+    # Uneven steps: some refill less than one request, some refill the whole burst
+    rng = random.Random(0)
+    while len(calls) < burst + total:
+        advance(limiter, clock, rng.uniform(0.5, 20))
+        # Served until the bucket is empty again, and every call served has reached the API
+        wait_until(lambda: (limiter.stats()["requests_available"] == 0 or not limiter.stats()["waiting"])
+                   and len(calls) + limiter.stats()["waiting"] == burst + total)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # Never more than the quota in any period
+    times = [at for at, _ in calls]
+    for i, start in enumerate(times):
+        assert sum(1 for at in times[i:] if at < start + period) <= rpm
+    # While an owner has calls waiting, every other owner gets at most one call out before its next one
+    order = [owner for _, owner in calls[burst:]]
+    assert Counter(order) == sessions
+    for owner in sessions:
+        positions = [-1] + [i for i, other in enumerate(order) if other == owner]
+        assert max(b - a for a, b in zip(positions, positions[1:])) <= len(sessions), (owner, order)
@@ -0,0 +1,49 @@
+"""Rendering receipts, including the partial results streamed while a response arrives."""
+import os
+import sys
+
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ri_system.render import items_column_config  # noqa: E402
+
+
+def render_partial():
+    import sys
+
+    import streamlit as st
+
+    sys.path.insert(0, st.session_state["root"])
+    from ri_system.render import display_results
+
+    display_results(st.session_state["data"])
+
+
+def render(data):
+    at = AppTest.from_function(render_partial)
+    at.session_state["root"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    at.session_state["data"] = data
+    return at.run()
+
+
+def test_partial_with_a_null_currency_symbol_renders():
+    # What the stream parser yields once the items have arrived but the symbol hasn't
+    partial = {
+        "bill_type": "Grocery",
+        "merchant_info": {"name": "Fresh Mart"},
+        "items": [{"item_name": "Milk", "quantity": 1, "unit_price": 2.5, "total_price": 2.5}],
+        "pricing": {"subtotal": 2.5, "total_amount": None, "currency": None, "currency_symbol": None},
+    }
+    at = render(partial)
+
+    assert not at.exception
+    assert len(at.dataframe) == 1
+
+
+def test_items_column_config_without_a_symbol():
+    config = items_column_config(["Unit Price", "Total"], None)
+
+    assert set(config) == {"Unit Price", "Total"}
+    assert config["Total"]["type_config"]["format"] == "%.2f"
+    assert items_column_config(["Total"], "%")["Total"]["type_config"]["format"] == "%%%.2f"
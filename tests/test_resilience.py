@@ -0,0 +1,257 @@
+"""Retries, backoff, circuit breaking and AIMD limits in `ri_system.resilience`.
+
+Every policy gets a fake clock, a recording sleep and a fixed random source,
+so the tests never wait and always take the same path.
+"""
+import os
+import sys
+import threading
+
+import httpx
+import pytest
+from google.genai import errors
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ri_system.resilience import (  # noqa: E402
+    AIMDLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    Resilience,
+    is_retryable,
+    retry_after,
+    slot_released,
+)
+
+
+class Clock:
+    """Monotonic clock that only moves when a test (or a sleep) advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class MaxRandom:
+    """`uniform(a, b)` always picks `b`, so backoff delays are their upper bound."""
+
+    def uniform(self, a, b):
+        return b
+
+
+def api_error(code, retry_delay=None):
+    cls = errors.ClientError if code < 500 else errors.ServerError
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}] if retry_delay else []
+    return cls(code, {"error": {"code": code, "status": str(code), "message": str(code), "details": details}})
+
+
+class FakeAPI:
+    """Raises the queued errors in order, then answers "ok"."""
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def sleeps(clock):
+    recorded = []
+
+    def sleep(seconds):
+        recorded.append(seconds)
+        clock.sleep(seconds)
+
+    sleep.recorded = recorded
+    return sleep
+
+
+def policy(clock, sleep, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(threshold=3, reset_after=30.0, clock=clock))
+    kwargs.setdefault("limiter", AIMDLimiter(initial=8, maximum=32, cooldown=1.0, clock=clock))
+    return Resilience(base_delay=1.0, max_delay=30.0, sleep=sleep, rng=MaxRandom(), **kwargs)
+
+
+def test_transient_errors_are_retried_until_success(clock, sleeps):
+    resilience = policy(clock, sleeps)
+    api = FakeAPI(api_error(503), api_error(500))
+
+    assert resilience.call(api) == "ok"
+    assert api.calls == 3
+    assert resilience.retries == 2
+    # Exponential backoff: 1s, then 2s
+    assert sleeps.recorded == [1.0, 2.0]
+
+
+def test_bad_request_is_not_retried(clock, sleeps):
+    resilience = policy(clock, sleeps)
+    api = FakeAPI(api_error(400))
+
+    with pytest.raises(errors.ClientError):
+        resilience.call(api)
+    assert api.calls == 1
+    assert resilience.retries == 0
+    assert sleeps.recorded == []
+    assert resilience.breaker.state == "closed"
+
+
+def test_gives_up_after_max_attempts(clock, sleeps):
+    resilience = policy(clock, sleeps, max_attempts=3)
+    api = FakeAPI(*(api_error(503) for _ in range(5)))
+
+    with pytest.raises(errors.ServerError):
+        resilience.call(api)
+    assert api.calls == 3
+    assert len(sleeps.recorded) == 2
+
+
+def test_backoff_doubles_up_to_the_cap(clock, sleeps):
+    resilience = policy(clock, sleeps)
+
+    assert [resilience.backoff(attempt) for attempt in range(1, 8)] == [1, 2, 4, 8, 16, 30, 30]
+
+
+def test_throttling_waits_for_the_retry_hint_and_halves_the_limit(clock, sleeps):
+    resilience = policy(clock, sleeps)
+    api = FakeAPI(api_error(429, retry_delay="7s"))
+
+    assert resilience.call(api) == "ok"
+    assert sleeps.recorded == [7.0]
+    assert resilience.throttled == 1
+    assert resilience.limiter.limit < 8
+    # Throttling means the API is up: it doesn't count towards opening the circuit
+    assert resilience.breaker.state == "closed"
+
+
+def test_open_circuit_fails_fast_and_a_probe_closes_it(clock, sleeps):
+    resilience = policy(clock, sleeps, max_attempts=1)
+    api = FakeAPI(*(api_error(503) for _ in range(3)))
+
+    for _ in range(3):
+        with pytest.raises(errors.ServerError):
+            resilience.call(api)
+    assert resilience.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        resilience.call(api)
+    assert api.calls == 3
+
+    clock.sleep(30.0)
+    assert resilience.breaker.state == "half-open"
+    assert resilience.call(api) == "ok"
+    assert resilience.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(threshold=2, reset_after=10.0, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    clock.sleep(10.0)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_aimd_halves_once_per_cooldown_and_grows_back(clock):
+    limiter = AIMDLimiter(initial=16, minimum=2, maximum=16, cooldown=1.0, clock=clock)
+
+    limiter.on_throttle()
+    # Calls that were already in flight fail together: count them once
+    limiter.on_throttle()
+    assert limiter.limit == 8
+
+    for _ in range(3):
+        clock.sleep(1.0)
+        limiter.on_throttle()
+    assert limiter.limit == 2
+
+    for _ in range(100):
+        limiter.on_success()
+    assert 2 < limiter.limit <= 16
+
+
+def test_overload_halves_the_limit_too(clock, sleeps):
+    resilience = policy(clock, sleeps, limiter=AIMDLimiter(maximum=32, cooldown=1.0, clock=clock))
+    assert resilience.limiter.limit == 32
+
+    assert resilience.call(FakeAPI(api_error(503))) == "ok"
+    assert resilience.limiter.limit < 32
+    # A 500 is a failure, not a sign of sending too much
+    clock.sleep(1.0)
+    limit = resilience.limiter.limit
+    assert resilience.call(FakeAPI(api_error(500))) == "ok"
+    assert resilience.limiter.limit >= limit
+
+
+def test_concurrent_calls_all_go_out_without_throttling(clock, sleeps):
+    callers = 32
+    resilience = policy(clock, sleeps, limiter=AIMDLimiter(maximum=callers, clock=clock))
+    # Every call waits for all the others to be in flight; a lower limit breaks the barrier
+    barrier = threading.Barrier(callers, timeout=5)
+    peak = []
+
+    def api():
+        peak.append(resilience.limiter.in_flight)
+        barrier.wait()
+        return "ok"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(resilience.call(api))) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert results == ["ok"] * callers
+    assert max(peak) == callers
+    assert not barrier.broken
+    assert sleeps.recorded == []
+
+
+def test_slot_released_hands_back_the_held_slot():
+    limiter = AIMDLimiter(initial=1)
+
+    with limiter.slot():
+        assert limiter.in_flight == 1
+        with slot_released():
+            assert limiter.in_flight == 0
+        assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+
+
+def test_error_classification():
+    assert is_retryable(api_error(429))
+    assert is_retryable(api_error(503))
+    assert not is_retryable(api_error(400))
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError("bad json"))
+
+
+def test_retry_after_reads_header_and_retry_info():
+    class Response:
+        headers = {"retry-after": "3"}
+
+    error = api_error(429)
+    error.response = Response()
+    assert retry_after(error) == 3.0
+    assert retry_after(api_error(429, retry_delay="1.5s")) == 1.5
+    assert retry_after(api_error(503)) is None